@@ -12,6 +12,15 @@ def linkAll(generator = None, assigner = None, workerPool = None, deducer = None
         deducer.link(workerPool)
 
 def hasDuplicatedAnswers(answers):
+    table = common.asAnswerTable(answers)
+    if table is not None:
+        # read the task ids only
+        taskSet = set()
+        for taskId in table.columns()[1]:
+            if taskId in taskSet:
+                return True
+            taskSet.add(taskId)
+        return False
     taskSet = set()
     for a in answers:
         if a.task.id in taskSet:
@@ -19,43 +28,103 @@ def hasDuplicatedAnswers(answers):
         taskSet.add(a.task.id)
     return False
 
-def evaluate(answers, detectDuplicate = False):
-    """evaluate the answers and return accuracy"""
+class Metrics:
+    """Accumulate the metrics of answers in a single pass
 
-    if detectDuplicate and hasDuplicatedAnswers(answers):
-        raise ValueError('Duplicated answers')
+    Answers are added by add() or addMany(), which take any iterable without
+    materializing it (AnswerTables are counted by bincount if NumPy is
+    available). If detectDuplicate, ValueError is raised once a task is
+    answered twice. The confusion matrix is as large as the label count of
+    the first task, and grows if a label is out of it. The labels and the
+    true labels should be ints (IndexError is raised if one is negative)."""
+    def __init__(self, detectDuplicate = False):
+        self.detectDuplicate = detectDuplicate
+        self.taskSet = set()
+        # matrix[actual_label][predict_label]
+        self.matrix = []
 
-    count = 0
-    totalCount = 0
-    for a in answers:
-        totalCount += 1
-        if a.label == a.task.trueLabel:
-            count += 1
-    return _mydiv(count, totalCount)
+    def add(self, answer):
+        self.addMany([answer])
+
+    def addMany(self, answers):
+        table = common.asAnswerTable(answers)
+        if table is not None and common.numpy is not None:
+            self._addTable(table)
+            return
+        matrix, taskSet = self.matrix, self.taskSet
+        detectDuplicate = self.detectDuplicate
+        for a in answers:
+            task = a.task
+            if detectDuplicate:
+                if task.id in taskSet:
+                    raise ValueError('Duplicated answers')
+                taskSet.add(task.id)
+            if a.label < 0 or task.trueLabel < 0:
+                # negative indices would count the answer in another cell
+                raise IndexError('list index out of range')
+            try:
+                matrix[task.trueLabel][a.label] += 1
+            except IndexError:
+                self._grow(max(task.labelCount, task.trueLabel + 1, a.label + 1))
+                matrix[task.trueLabel][a.label] += 1
+
+    @property
+    def count(self):
+        return sum(map(sum, self.matrix))
+
+    def accuracy(self):
+        return _mydiv(sum(self.matrix[i][i] for i in range(len(self.matrix))), self.count)
+
+    def confusionMatrix(self):
+        """return confusionMatrix[actual_label][predict_label]"""
+        return [list(row) for row in self.matrix]
+
+    def binaryTaskMetrics(self):
+        return getBinaryTaskMetrics(self.matrix)
+
+    def _grow(self, labelCount):
+        for row in self.matrix:
+            row.extend([0] * (labelCount - len(row)))
+        self.matrix.extend([0] * labelCount for i in range(labelCount - len(self.matrix)))
+
+    def _addTable(self, table):
+        numpy = common.numpy
+        if len(table) == 0:
+            return
+        workerIds, taskIds, labels = table.arrays()
+        if self.detectDuplicate:
+            ids, counts = numpy.unique(taskIds, return_counts = True)
+            ids = ids.tolist()
+            if counts.max() > 1 or not self.taskSet.isdisjoint(ids):
+                raise ValueError('Duplicated answers')
+            self.taskSet.update(ids)
+        trueLabels = table.taskArray('trueLabel')[taskIds]
+        if labels.min() < 0 or trueLabels.min() < 0:
+            raise IndexError('list index out of range')
+        if not self.matrix:
+            self._grow(table[0].task.labelCount)
+        self._grow(max(len(self.matrix), int(labels.max()) + 1, int(trueLabels.max()) + 1))
+        size = len(self.matrix)
+        counts = numpy.bincount(trueLabels * size + labels, minlength = size * size)
+        for key in numpy.flatnonzero(counts).tolist():
+            i, j = divmod(key, size)
+            self.matrix[i][j] += int(counts[key])
+
+def evaluate(answers, detectDuplicate = False):
+    """evaluate the answers and return accuracy"""
+    metrics = Metrics(detectDuplicate)
+    metrics.addMany(answers)
+    return metrics.accuracy()
 
 def getConfusionMatrix(answers, detectDuplicate = False):
     """evaluate the answers and return confusion matrix
     
-    All tasks should have the same label counts. The return confusion matrix's
-    structure is: confusionMatrix[actual_label][predict_label]
+    The return confusion matrix's structure is:
+    confusionMatrix[actual_label][predict_label]
     """
-    if detectDuplicate and hasDuplicatedAnswers(answers):
-        raise ValueError('Duplicated answers')
-
-    # confusionMatrix[actual_label][predict_label]
-    it = iter(answers)
-    a = next(it)
-    labelCount = a.task.labelCount
-    confusionMatrix = [ [0 for i in range(labelCount)] for j in range(labelCount)]
-    confusionMatrix[a.task.trueLabel][a.label] += 1
-    while True:
-        try:
-            a = next(it)
-        except StopIteration:
-            break
-        else:
-            confusionMatrix[a.task.trueLabel][a.label] += 1
-    return confusionMatrix
+    metrics = Metrics(detectDuplicate)
+    metrics.addMany(answers)
+    return metrics.confusionMatrix()
 
 
 def getBinaryTaskMetrics(confusionMatrix):
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
-import time, hmac, hashlib, base64
+import time, hmac, hashlib, base64, random, threading, functools, math
+import collections, concurrent.futures, contextvars
 import requests
 import xml.etree.ElementTree as et
 from collections import namedtuple
@@ -54,14 +55,73 @@ class flags:
         rejected = 'Rejected'
         #approvedOrRejected = [Approved,Rejected]
 
+class OperationStats:
+    """Latency counters of an operation (in seconds)
+
+    A request is counted once however many times it is posted; retries
+    counts the extra posts and failures the requests given up."""
+    __slots__ = ('count', 'retries', 'failures', 'totalTime', 'maxTime')
+    def __init__(self):
+        self.count = self.retries = self.failures = 0
+        self.totalTime = self.maxTime = 0.0
+
+    def record(self, elapsed, retries, failed = False):
+        self.count += 1
+        self.retries += retries
+        self.failures += failed
+        self.totalTime += elapsed
+        self.maxTime = max(self.maxTime, elapsed)
+
+    @property
+    def meanTime(self):
+        return self.totalTime / self.count if self.count else 0.0
+
+    def __repr__(self):
+        return 'OperationStats(count={}, retries={}, failures={}, meanTime={:.4f}, maxTime={:.4f})'.format(
+                self.count, self.retries, self.failures, self.meanTime, self.maxTime)
+
+def operation(method):
+    """Turn a generator into an API operation of AMT
+
+    The generator yields the arguments of AMT.request() and receives its
+    return values, so that the same operation can be run by the blocking AMT
+    and by asyncAMT.AsyncAMT (see AMT._run())."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return self._run(method(self, *args, **kwargs))
+    return wrapper
+
+def _callState(name, default = None):
+    """A read-only attribute of the last call in the current thread (or
+    asyncio task), see AMT._setCallState()"""
+    return property(lambda self: self._callStates.get({}).get(name, default))
+
 class AMT:
+    # the HTTP status codes of throttled requests
+    throttlingStatus = (429, 503)
+
+    # the state of the last call, kept apart for each thread and asyncio
+    # task since the calls can run concurrently on the same AMT
+    respondCache = _callState('respondCache')
+    uuidCache = _callState('uuidCache')
+    HITAlreadyExists = _callState('HITAlreadyExists', False)
+    duplicateExtendHIT = _callState('duplicateExtendHIT', False)
+
     def __init__(self, keyId, secret, useSandbox = True, verify = True, timeout
-            = 5.0, tries = 5, uuidGenerator = uuid.uuid1, debug = False):
+            = 5.0, tries = 5, uuidGenerator = uuid.uuid1, debug = False,
+            poolSize = 10, backoff = 0.5, maxBackoff = 30.0, serviceUrl = None):
         '''Init...
 
         `timeout` will be passed to requests.post() and `tries` indicate
         the maximal times to call the post() method when encounter Timeout
-        exceptions.
+        or connection errors or throttling responses (see throttlingStatus).
+        Before the i-th retry, it sleeps a random time in [0, min(maxBackoff,
+        backoff * 2 ** (i - 1))] seconds.
+
+        The requests share a requests.Session keeping up to `poolSize`
+        connections alive. serviceUrl overrides the URL chosen by useSandbox
+        (e.g. to use a local stub server). The latency counters of each
+        operation are kept in self.stats (a dict of OperationStats).
 
         uuidGenerator will be used for createHIT() and extendHIT()'''
 
@@ -70,22 +130,79 @@ class AMT:
         self.verify = verify
         self.timeout = timeout
         self.tries = tries
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
         self.uuidGenerator = lambda : str(uuidGenerator())
         self.debug = debug
-        if useSandbox:
+        if serviceUrl is not None:
+            self.service_url = serviceUrl
+        elif useSandbox:
             self.service_url='https://mechanicalturk.sandbox.amazonaws.com/'
         else:
             self.service_url='https://mechanicalturk.amazonaws.com/'
+        self.stats = {}
+        self.statsLock = threading.Lock()
+        self._callStates = contextvars.ContextVar('callStates')
+        self._openSession(poolSize)
+
+    def _openSession(self, poolSize):
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections = 1, pool_maxsize = poolSize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
     def request(self, operation, parameters = None, addUuid = False):
         """parameters should be None or a dict. Return (AMTRespond, multipleRequest)
 
-        multipleRequest == True if the requests.post() has been called multiple
-        times because of timeout.
+        multipleRequest == True if the request has been posted multiple times
+        because of timeout, connection errors or throttling. If all the tries
+        fail with exceptions, the last one is raised, and if the last try is
+        still throttled, requests.HTTPError is raised (its `response` keeps
+        the status code).
         
         If parameters is a dict, the value for each item in the dict can be
         str, int, float, a instance of some namedtuple, or a iterable contains
         the type just mentioned."""
+        parameters = self._prepareParameters(operation, parameters, addUuid)
+        startTime = time.perf_counter()
+        for tryTimes in range(self.tries):
+            if tryTimes > 0:
+                time.sleep(random.uniform(0, min(self.maxBackoff, self.backoff * 2 ** (tryTimes - 1))))
+            try:
+                request = self.session.post(self.service_url, params = parameters, verify = self.verify, timeout = self.timeout)
+            except (requests.Timeout, requests.ConnectionError) as e:
+                logging.warning('Requests {}: #{}'.format(type(e).__name__, tryTimes + 1))
+                error = e
+                continue
+            if request.status_code in self.throttlingStatus and tryTimes + 1 < self.tries:
+                logging.warning('Requests throttled (HTTP {}): #{}'.format(request.status_code, tryTimes + 1))
+                continue
+            break
+        else:
+            self._record(operation, startTime, tryTimes, failed = True)
+            raise error
+        if request.status_code in self.throttlingStatus:
+            self._record(operation, startTime, tryTimes, failed = True)
+            request.raise_for_status()
+        self._record(operation, startTime, tryTimes)
+        if self.debug:
+            logging.debug('request url: ' + request.url)
+            logging.debug('respond text:\n' + minidom.parseString(request.text).toprettyxml())
+        respond = AMTRespond(request.text)
+        self._setCallState(respondCache = respond)
+        return (respond, tryTimes > 0)
+
+    def _prepareParameters(self, operation, parameters, addUuid):
+        """return the flattened and signed parameters of a request"""
         if parameters is None:
             parameters = dict()
         else:
@@ -97,59 +214,71 @@ class AMT:
         parameters['Timestamp'] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
         parameters['Signature'] = self._generateSignature(parameters)
         if addUuid:
-            self.uuidCache = parameters['UniqueRequestToken'] = self.uuidGenerator()
-        else:
-            self.uuidCache = None
-
-        for tryTimes in range(self.tries):
-            try:
-                request = requests.post(self.service_url, params = parameters, verify = self.verify, timeout = self.timeout)
-            except requests.Timeout:
-                logging.warning('Requests timeout: #{}'.format(tryTimes + 1))
-                continue
-            break
-        if self.debug:
-            logging.debug('request url: ' + request.url)
-            logging.debug('respond text:\n' + minidom.parseString(request.text).toprettyxml())
-        self.respondCache = AMTRespond(request.text)
-        return (self.respondCache, tryTimes > 1)
+            parameters['UniqueRequestToken'] = self.uuidGenerator()
+        self._setCallState(uuidCache = parameters.get('UniqueRequestToken'))
+        return parameters
+
+    def _setCallState(self, **values):
+        # the dict is copied so that the contexts copied from this one (e.g.
+        # of the asyncio tasks created here) keep their own states
+        self._callStates.set(dict(self._callStates.get({}), **values))
+
+    def _record(self, operation, startTime, retries, failed = False):
+        elapsed = time.perf_counter() - startTime
+        with self.statsLock:
+            stats = self.stats.get(operation)
+            if stats is None:
+                stats = self.stats[operation] = OperationStats()
+            stats.record(elapsed, retries, failed)
+
+    def _run(self, steps):
+        """Run the generator of an operation (see operation())"""
+        respond = None
+        try:
+            while True:
+                respond = self.request(*steps.send(respond))
+        except StopIteration as stop:
+            return stop.value
 
+    @operation
     def getAccountBalance(self):
-        r = self.request('GetAccountBalance')[0]
+        r = (yield 'GetAccountBalance',)[0]
         if r.valid:
             return float(r['AvailableBalance/Amount'])
 
+    @operation
     def createHIT(self, HITParameters, responseGroup : flags.responseGroup = None):
         """CreateHIT based on HITParameters, which should be of type "HITParameters"
         
         return (HITId, HITTypeId, HITXmlElement) or None"""
         params = HITParameters.parameters.copy()
         params['ResponseGroup'] = responseGroup
-        self.HITAlreadyExists = False
-        r, multipleRequest = self.request('CreateHIT', params, addUuid = True)
+        self._setCallState(HITAlreadyExists = False)
+        r, multipleRequest = yield 'CreateHIT', params, True
         if r.valid:
             return (r['HITId'], r['HITTypeId'], r.result)
         elif multipleRequest:
-            code = self.respondCache.result.findtext('Request/Errors/Error/Code')
+            code = r.result.findtext('Request/Errors/Error/Code')
             if code == "AWS.MechanicalTurk.HITAlreadyExists":
                 # if this happen, the hit is actuall created successfully, but
                 # r.valud == False because of multiple CreateHIT operation with
                 # the same uuid
-                self.HITAlreadyExists = True
+                self._setCallState(HITAlreadyExists = True)
                 logging.warning('creatHIT encounters error "HITAlreadExists"')
-                for element in self.respondCache.result.findall('Request/Errors/Error/Data'):
+                for element in r.result.findall('Request/Errors/Error/Data'):
                     if element.findtext('Key') == 'HITId':
                         hitId = element.findtext('Value')
                         if hitId is not None:
                             break
                 else:
                     raise RuntimeError('Cannot get HITId')
-                r = self.getHIT(hitId, responseGroup = responseGroup)
-                typeId = r.findtext('HITTypeId')
+                r = (yield 'GetHIT', {'HITId' : hitId, 'ResponseGroup' : responseGroup})[0]
+                typeId = r.result.findtext('HITTypeId') if r.valid else None
                 if typeId is None:
                     raise RuntimeError('Cannot get HITTypeId')
-                return (hitId, typeId, r)
+                return (hitId, typeId, r.result)
 
+    @operation
     def registerHITType(self, title, description, rewardAmount, assignmentDurationInSeconds, keywords = None, autoApprovalDelayInSeconds = None, qualificationRequirement = None):
         parameters = {
             'Title'                       : title,
@@ -161,13 +290,14 @@ class AMT:
             'QualificationRequirement'    : qualificationRequirement
         }
         
-        r = self.request('RegisterHITType', parameters)[0]
+        r = (yield 'RegisterHITType', parameters)[0]
         if r.valid:
             return r['HITTypeId']
 
     def getReviewableHITs(self, HITTypeId = None, status : flags.status = None,
             sortProperty : flags.sortProperty = None, sortDirection :
-            flags.sortDirection = None, pageSize = None, pageNumber = None):
+            flags.sortDirection = None, pageSize = None, pageNumber = None,
+            stream = False, prefetch = 0):
         """Retrieve HITs and return a list of deduplicated HITId
         
         see _getPages() for more help"""
@@ -180,12 +310,14 @@ class AMT:
             'PageNumber'    : pageNumber,
         }
         return self._getPages('GetReviewableHITs', parameters, lambda x :
-                x.findall('HIT'), lambda x : x.findtext('HITId'), lambda i, e: i)
+                x.findall('HIT'), lambda x : x.findtext('HITId'), lambda i, e: i,
+                stream, prefetch)
 
     def getAssignmentsForHIT(self, id, assignmentStatus :
             flags.assignmentStatus = None, sortProperty : flags.sortProperty =
             None, sortDirection : flags.sortDirection = None, pageSize = None,
-            pageNumber = None, responseGroup : flags.responseGroup = None):
+            pageNumber = None, responseGroup : flags.responseGroup = None,
+            stream = False, prefetch = 0):
         '''Retrieve and return a deduplicated list of tuples (assignmentId, answerDict, assignment)
 
         The `assignment` is an xml elements and the `answerDict` is a dict
@@ -212,11 +344,12 @@ class AMT:
 
         return self._getPages('GetAssignmentsForHIT', parameters, lambda r :
                 r.findall('Assignment'), lambda e : e.findtext('AssignmentId'),
-                constructTuple)
+                constructTuple, stream, prefetch)
 
     def searchHITs(self, sortProperty : flags.sortProperty = None,
             sortDirection : flags.sortDirection = None, pageNumber = None,
-            pageSize = None, responseGroup : flags.responseGroup = None):
+            pageSize = None, responseGroup : flags.responseGroup = None,
+            stream = False, prefetch = 0):
         """Retrieve HITs and return a deduplicated list of HIT xml element
 
         See _getPages() for more help"""
@@ -229,35 +362,39 @@ class AMT:
             'ResponseGroup' : responseGroup
         }
         return self._getPages('SearchHITs', parameters, lambda x : x.findall('HIT'),
-                lambda x : x.findtext('HITId'), lambda i, e : e)
+                lambda x : x.findtext('HITId'), lambda i, e : e, stream, prefetch)
 
+    @operation
     def disposeHIT(self, id): 
-        r = self.request('DisposeHIT', {'HITId': id})[0]
+        r = (yield 'DisposeHIT', {'HITId': id})[0]
         return r.valid
 
+    @operation
     def disableHIT(self, id): 
-        r = self.request('DisableHIT', {'HITId': id})[0]
+        r = (yield 'DisableHIT', {'HITId': id})[0]
         return r.valid
 
+    @operation
     def forceExpireHIT(self, id):
-        r = self.request('ForceExpireHIT', {'HITId': id})[0]
+        r = (yield 'ForceExpireHIT', {'HITId': id})[0]
         return r.valid
 
+    @operation
     def extendHIT(self, id, maxAssignmentsIncrement = None, expirationIncrementInSeconds = None):
         parameters = {
             'HITId'                           : id,
             'MaxAssignmentsIncrement'      : maxAssignmentsIncrement,
             'ExpirationIncrementInSeconds' : expirationIncrementInSeconds,
         }
-        r, multipleRequest = self.request('ExtendHIT', parameters, addUuid = True)
-        self.duplicateExtendHIT = False
+        r, multipleRequest = yield 'ExtendHIT', parameters, True
+        self._setCallState(duplicateExtendHIT = False)
         if r.valid:
             return r.valid
         if multipleRequest:
             code = r.result.findtext('Request/Errors/Error/Code')
             if code == 'AWS.MechanicalTurk.DuplicateCall':
                 logging.warning('extendHIT encounters error "DuplicateCall"')
-                self.duplicateExtendHIT = True
+                self._setCallState(duplicateExtendHIT = True)
                 return True
         return False
 
@@ -266,22 +403,25 @@ class AMT:
     def toReviewable(self, id):
         return self._setHITAsReviewing(id, revert = 'true')
 
+    @operation
     def approveAssignment(self, assignmentId, requesterFeedback = None):
         parameters = {
             'AssignmentId'      : assignmentId,
             'RequesterFeedback' : requesterFeedback,
         }
-        return self.request('ApproveAssignment', parameters)[0].valid
+        return (yield 'ApproveAssignment', parameters)[0].valid
 
+    @operation
     def rejectAssignment(self, assignmentId, requesterFeedback = None):
         parameters = {
             'AssignmentId'      : assignmentId,
             'RequesterFeedback' : requesterFeedback,
         }
-        return self.request('RejectAssignment', parameters)[0].valid
+        return (yield 'RejectAssignment', parameters)[0].valid
 
+    @operation
     def getHIT(self, id, responseGroup : flags.responseGroup = None):
-        r = self.request('GetHIT', {'HITId' : id, 'ResponseGroup' : responseGroup})[0]
+        r = (yield 'GetHIT', {'HITId' : id, 'ResponseGroup' : responseGroup})[0]
         if r.valid:
             return r.result
 
@@ -326,7 +466,7 @@ class AMT:
     def _generateSignature(self, parameters):
         msg = parameters['Service'] + parameters['Operation'] + parameters['Timestamp']
         s = hmac.new(self.bSecret, msg.encode('utf-8'), hashlib.sha1).digest()
-        return base64.encodestring(s).strip()
+        return base64.encodebytes(s).strip()
 
     def _isNamedtuple(self, value):
         try:
@@ -367,7 +507,8 @@ class AMT:
         for name in value._fields:
             parameters[prefix + name] = getattr(value, name)
 
-    def _getPages(self, operation, param : dict, elementExtracter : callable, idExtracter : callable, handler : callable):
+    def _getPages(self, operation, param : dict, elementExtracter : callable,
+            idExtracter : callable, handler : callable, stream = False, prefetch = 0):
         '''A common function for API that retrieve data based on page number.
 
         If one of the respond is invalid or idExtracter() return None, the
@@ -384,39 +525,88 @@ class AMT:
         The returned list is deduplicated based on the id.
 
         handler(id, element) is a callable object that return a value to be
-        appended to the returned list.'''
+        appended to the returned list.
 
-        getAllPages = False
-        if param['PageNumber'] is None:
-            param['PageNumber'] = 1
-            getAllPages = True
-        returnList = []
-        idSet = set()
-        while True:
-            r = self.request(operation, param)[0]
-            if not r.valid:
-                return
-            if int(r['NumResults']) == 0:
-                break
-            for element in elementExtracter(r.result):
-                id = idExtracter(element)
-                assert(id is not None)
-                if id not in idSet:
-                    idSet.add(id)
-                    returnList.append(handler(id, element))
-            if getAllPages == False:
-                break
-            param['PageNumber'] += 1
-        return returnList
+        If stream is True, the generator _iterPages() is returned instead of
+        the list, see it for `prefetch`.'''
 
+        pages = self._iterPages(operation, param, elementExtracter, idExtracter, handler, prefetch)
+        if stream:
+            return pages
+        try:
+            return list(pages)
+        except InvalidRespond:
+            return None
+
+    def _iterPages(self, operation, param, elementExtracter, idExtracter, handler, prefetch = 0):
+        '''The generator version of _getPages() yielding the values as the pages arrive
+
+        Up to `prefetch` pages after the current one are requested at the
+        same time by a thread pool (no further than the last page according
+        to the TotalNumResults of page 1, if it is given). InvalidRespond is
+        raised if a respond is invalid.'''
+
+        getAllPages = param['PageNumber'] is None
+        page = lastPage = 1 if getAllPages else param['PageNumber']
+        request = lambda page : self.request(operation, dict(param, PageNumber = page))[0]
+        executor = None
+        if getAllPages and prefetch > 0:
+            executor = concurrent.futures.ThreadPoolExecutor(prefetch)
+        # futures of pages page + 1, ..., lastPage
+        pending = collections.deque()
+        idSet = set()
+        try:
+            r = request(page)
+            while True:
+                if not r.valid:
+                    raise InvalidRespond(r)
+                if int(r['NumResults']) == 0:
+                    return
+                if executor is not None:
+                    if page == 1:
+                        endPage = _lastPage(r)
+                    while len(pending) < prefetch and (endPage is None or lastPage < endPage):
+                        lastPage += 1
+                        pending.append(executor.submit(request, lastPage))
+                yield from _pageValues(r, idSet, elementExtracter, idExtracter, handler)
+                if getAllPages == False:
+                    return
+                page += 1
+                r = pending.popleft().result() if pending else request(page)
+                lastPage = max(lastPage, page)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait = False, cancel_futures = True)
+
+    @operation
     def _setHITAsReviewing(self, id, revert):
         '''Don't use this function directly. Use toReviewing()/toReviewable()'''
-        r = self.request('SetHITAsReviewing', {'HITId' : id, 'Revert' : revert})[0]
+        r = (yield 'SetHITAsReviewing', {'HITId' : id, 'Revert' : revert})[0]
         return r.valid
 
 
 
 
+class InvalidRespond(Exception):
+    """Raised by AMT._iterPages() on an invalid respond (the `respond` attribute)"""
+    def __init__(self, respond):
+        super().__init__('Invalid respond')
+        self.respond = respond
+
+def _lastPage(respond):
+    """return the number of the empty page after the pages (or None if unknown) based on page 1"""
+    if respond['TotalNumResults'] is not None:
+        return math.ceil(int(respond['TotalNumResults']) / int(respond['NumResults'])) + 1
+
+def _pageValues(respond, idSet, elementExtracter, idExtracter, handler):
+    """yield handler(id, element) of the elements of a page whose id is not in idSet"""
+    for element in elementExtracter(respond.result):
+        id = idExtracter(element)
+        assert(id is not None)
+        if id not in idSet:
+            idSet.add(id)
+            yield handler(id, element)
+
 class AMTRespond:
     def __init__(self, xml):
         self.xml = xml
@@ -514,3 +704,28 @@ def xmlPrettyPrint(source):
     else:
         string = source
     print(minidom.parseString(string).toprettyxml())
+
+#### test AMT.request against a local stub server: the requests share one connection
+#import threading
+#from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+#class StubHandler(BaseHTTPRequestHandler):
+#    protocol_version = 'HTTP/1.1'
+#    disable_nagle_algorithm = True
+#    connections = set()
+#    def log_message(self, *args):
+#        pass
+#    def do_POST(self):
+#        self.connections.add(self.client_address)
+#        body = (b'<GetAccountBalanceResponse><GetAccountBalanceResult><Request><IsValid>True</IsValid></Request>'
+#                b'<AvailableBalance><Amount>10.00</Amount></AvailableBalance></GetAccountBalanceResult></GetAccountBalanceResponse>')
+#        self.send_response(200)
+#        self.send_header('Content-Length', str(len(body)))
+#        self.end_headers()
+#        self.wfile.write(body)
+#server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+#threading.Thread(target = server.serve_forever, daemon = True).start()
+#with AMT('keyId', 'secret', serviceUrl = 'http://127.0.0.1:{}/'.format(server.server_address[1])) as amt:
+#    for i in range(100):
+#        assert amt.getAccountBalance() == 10.0
+#    print(amt.stats, len(StubHandler.connections))
+#server.shutdown()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""An asyncio version of AMT.AMT based on aiohttp"""
+
+import asyncio, collections, logging, math, random, ssl, time
+import xml.dom.minidom as minidom
+import aiohttp
+from .AMT import AMT, AMTRespond, InvalidRespond, _lastPage, _pageValues
+
+class AsyncAMT(AMT):
+    """The same API as AMT.AMT, but the operations are coroutines
+
+    e.g.
+        async with AsyncAMT(keyId, secret) as amt:
+            hitIds = await amt.getReviewableHITs()
+            assignments = await asyncio.gather(*[amt.getAssignmentsForHIT(x) for x in hitIds])
+
+    The parameters flattening, the signature and the parsing of the responds
+    are shared with AMT.AMT, and the requests of all the operations share an
+    aiohttp.ClientSession keeping up to `poolSize` connections alive, so many
+    operations (or campaigns) can run concurrently in one thread. Use
+    `async with` or close() to close the session."""
+
+    def _openSession(self, poolSize):
+        # aiohttp.ClientSession should be created in a running event loop, so
+        # it is created by the first request
+        self.poolSize = poolSize
+        self.session = None
+
+    def _getSession(self):
+        if self.session is None:
+            if self.verify is True:
+                sslContext = None
+            elif not self.verify:
+                sslContext = False
+            else:
+                # a path to the CA bundle, as accepted by requests
+                sslContext = ssl.create_default_context(cafile = self.verify)
+            self.session = aiohttp.ClientSession(
+                    connector = aiohttp.TCPConnector(limit = self.poolSize, ssl = sslContext),
+                    timeout = aiohttp.ClientTimeout(total = self.timeout))
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def request(self, operation, parameters = None, addUuid = False):
+        """The coroutine version of AMT.request()
+
+        If the last try is still throttled, aiohttp.ClientResponseError
+        (whose `status` is the status code) is raised."""
+        parameters = self._prepareParameters(operation, parameters, addUuid)
+        # like requests, drop the parameters whose values are None
+        query = {k : v.decode('utf-8') if isinstance(v, bytes) else str(v)
+                for k, v in parameters.items() if v is not None}
+        session = self._getSession()
+        startTime = time.perf_counter()
+        for tryTimes in range(self.tries):
+            if tryTimes > 0:
+                await asyncio.sleep(random.uniform(0, min(self.maxBackoff, self.backoff * 2 ** (tryTimes - 1))))
+            try:
+                async with session.post(self.service_url, params = query) as respond:
+                    status = respond.status
+                    text = await respond.text()
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+                logging.warning('Requests {}: #{}'.format(type(e).__name__, tryTimes + 1))
+                error = e
+                continue
+            if status in self.throttlingStatus and tryTimes + 1 < self.tries:
+                logging.warning('Requests throttled (HTTP {}): #{}'.format(status, tryTimes + 1))
+                continue
+            break
+        else:
+            self._record(operation, startTime, tryTimes, failed = True)
+            raise error
+        if status in self.throttlingStatus:
+            self._record(operation, startTime, tryTimes, failed = True)
+            respond.raise_for_status()
+        self._record(operation, startTime, tryTimes)
+        if self.debug:
+            logging.debug('request url: ' + str(respond.url))
+            logging.debug('respond text:\n' + minidom.parseString(text).toprettyxml())
+        amtRespond = AMTRespond(text)
+        self._setCallState(respondCache = amtRespond)
+        return (amtRespond, tryTimes > 0)
+
+    async def _run(self, steps):
+        respond = None
+        try:
+            while True:
+                respond = await self.request(*steps.send(respond))
+        except StopIteration as stop:
+            return stop.value
+
+    def _getPages(self, operation, param : dict, elementExtracter : callable,
+            idExtracter : callable, handler : callable, stream = False, prefetch = 0):
+        '''Return a coroutine of the list of AMT._getPages(), or the
+        asynchronous generator _iterPages() if stream is True
+
+        If param["PageNumber"] is None, the coroutine fetches the first page
+        and then the other pages (according to TotalNumResults / NumResults
+        of the first page) concurrently. Like AMT._getPages(), the pages
+        after them are fetched until int(response['NumResults']) == 0 and
+        elements with smaller page numbers appear first.'''
+        if stream:
+            return self._iterPages(operation, param, elementExtracter, idExtracter, handler, prefetch)
+        return self._gatherPages(operation, param, elementExtracter, idExtracter, handler)
+
+    async def _gatherPages(self, operation, param, elementExtracter, idExtracter, handler):
+
+        getAllPages = False
+        if param['PageNumber'] is None:
+            param['PageNumber'] = 1
+            getAllPages = True
+        r = (await self.request(operation, param))[0]
+        responds = [r]
+        if getAllPages and r.valid and int(r['NumResults']) > 0 and r['TotalNumResults'] is not None:
+            pageCount = math.ceil(int(r['TotalNumResults']) / int(r['NumResults']))
+            pages = await asyncio.gather(*[self.request(operation, dict(param, PageNumber = i))
+                    for i in range(2, pageCount + 1)])
+            responds.extend(x[0] for x in pages)
+            param['PageNumber'] = pageCount
+        returnList = []
+        idSet = set()
+        while True:
+            for r in responds:
+                if not r.valid:
+                    return
+                if int(r['NumResults']) == 0:
+                    return returnList
+                returnList.extend(_pageValues(r, idSet, elementExtracter, idExtracter, handler))
+            if getAllPages == False:
+                return returnList
+            param['PageNumber'] += 1
+            responds = [(await self.request(operation, param))[0]]
+
+    async def _iterPages(self, operation, param, elementExtracter, idExtracter, handler, prefetch = 0):
+        '''The asynchronous generator version of AMT._iterPages()
+
+        The `prefetch` pages after the current one are requested by tasks.'''
+        getAllPages = param['PageNumber'] is None
+        page = lastPage = 1 if getAllPages else param['PageNumber']
+        async def request(page):
+            return (await self.request(operation, dict(param, PageNumber = page)))[0]
+        # tasks of pages page + 1, ..., lastPage
+        pending = collections.deque()
+        idSet = set()
+        try:
+            r = await request(page)
+            while True:
+                if not r.valid:
+                    raise InvalidRespond(r)
+                if int(r['NumResults']) == 0:
+                    return
+                if getAllPages and prefetch > 0:
+                    if page == 1:
+                        endPage = _lastPage(r)
+                    while len(pending) < prefetch and (endPage is None or lastPage < endPage):
+                        lastPage += 1
+                        pending.append(asyncio.ensure_future(request(lastPage)))
+                for value in _pageValues(r, idSet, elementExtracter, idExtracter, handler):
+                    yield value
+                if getAllPages == False:
+                    return
+                page += 1
+                r = await (pending.popleft() if pending else request(page))
+                lastPage = max(lastPage, page)
+        finally:
+            for task in pending:
+                task.cancel()
+
+#### test AsyncAMT against a local stub server: 5 pages of reviewable HITs
+#import threading, urllib.parse
+#from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+#class StubHandler(BaseHTTPRequestHandler):
+#    protocol_version = 'HTTP/1.1'
+#    disable_nagle_algorithm = True
+#    def log_message(self, *args):
+#        pass
+#    def do_POST(self):
+#        query = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+#        page = int(query['PageNumber'])
+#        ids = range((page - 1) * 10, min(page * 10, 45))
+#        body = ('<GetReviewableHITsResponse><GetReviewableHITsResult><Request><IsValid>True</IsValid></Request>'
+#                '<NumResults>{}</NumResults><TotalNumResults>45</TotalNumResults><PageNumber>{}</PageNumber>{}'
+#                '</GetReviewableHITsResult></GetReviewableHITsResponse>').format(len(ids), page,
+#                        ''.join('<HIT><HITId>{}</HITId></HIT>'.format(x) for x in ids)).encode('utf-8')
+#        self.send_response(200)
+#        self.send_header('Content-Length', str(len(body)))
+#        self.end_headers()
+#        self.wfile.write(body)
+#server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+#threading.Thread(target = server.serve_forever, daemon = True).start()
+#async def main():
+#    async with AsyncAMT('keyId', 'secret', serviceUrl = 'http://127.0.0.1:{}/'.format(server.server_address[1])) as amt:
+#        hitIds = await amt.getReviewableHITs()
+#        assert hitIds == [str(x) for x in range(45)]
+#        print(amt.stats)
+#asyncio.run(main())
+#server.shutdown()
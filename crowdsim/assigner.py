@@ -1,10 +1,11 @@
 from .common import *
-import collections
+import array, bisect
 
 class BaseAssigner:
     pass
 
 class AssignInfo:
+    __slots__ = ('unconfirmedWorkers', 'confirmedWorkers')
     def __init__(self):
         self.unconfirmedWorkers = set()
         self.confirmedWorkers = set()
@@ -22,46 +23,287 @@ class AssignInfo:
         return len(self.unconfirmedWorkers) + len(self.confirmedWorkers)
     def confirmedCount(self):
         return len(self.confirmedWorkers)
+    def unconfirmedCount(self):
+        return len(self.unconfirmedWorkers)
+
+class AssignInfoDict:
+    """The assignments and the answer counts (yes, no) of the unfinished
+    tasks, kept as a dict from task to [yes, no, AssignInfo]."""
+    def __init__(self, tasks):
+        self.task_to_yes_no_assignInfo = {t : [0, 0, AssignInfo()] for t in tasks}
+    def __len__(self):
+        return len(self.task_to_yes_no_assignInfo)
+    def __contains__(self, task):
+        return task in self.task_to_yes_no_assignInfo
+    def __delitem__(self, task):
+        del self.task_to_yes_no_assignInfo[task]
+    def assign(self, task, worker):
+        self.task_to_yes_no_assignInfo[task][-1].assign(worker)
+    def confirm(self, task, worker):
+        self.task_to_yes_no_assignInfo[task][-1].confirm(worker)
+    def abandon(self, task, worker):
+        self.task_to_yes_no_assignInfo[task][-1].abandon(worker)
+    def isAssigned(self, task, worker):
+        """return whether the task has been assigned to the worker (confirmed or not)"""
+        return worker in self.task_to_yes_no_assignInfo[task][-1]
+    def count(self, task):
+        return len(self.task_to_yes_no_assignInfo[task][-1])
+    def confirmedCount(self, task):
+        return self.task_to_yes_no_assignInfo[task][-1].confirmedCount()
+    def unconfirmedCount(self, task):
+        return self.task_to_yes_no_assignInfo[task][-1].unconfirmedCount()
+    def getAnswers(self, task):
+        """return (yes, no)"""
+        yes, no, assignInfo = self.task_to_yes_no_assignInfo[task]
+        return yes, no
+    def setAnswers(self, task, yes, no):
+        self.task_to_yes_no_assignInfo[task][:2] = yes, no
+
+class AssignInfoTable:
+    """A compact replacement of AssignInfoDict for tasks with integer ids
+    (e.g. SimpleTask.id of GeneralGenerator).
+
+    The counters are kept in arrays indexed by task id. The workers are
+    numbered in the order they are seen, and the workers of a task are kept
+    in a sorted array of 2 * number + confirmed (None if there is no
+    worker), so the memory of a task grows with the number of its workers
+    only."""
+    def __init__(self, tasks):
+        ids = [t.id for t in tasks]
+        size = max(ids) + 1 if ids else 0
+        self.live = bytearray(size)
+        for i in ids:
+            self.live[i] = 1
+        self.liveCount = len(ids)
+        self.yes = array.array('i', bytes(4 * size))
+        self.no = array.array('i', bytes(4 * size))
+        self.unconfirmedCounts = array.array('i', bytes(4 * size))
+        self.confirmedCounts = array.array('i', bytes(4 * size))
+        self.workers = [None] * size
+        self.workerToIndex = {}
+    def __len__(self):
+        return self.liveCount
+    def __contains__(self, task):
+        return 0 <= task.id < len(self.live) and self.live[task.id] == 1
+    def __delitem__(self, task):
+        i = self._index(task)
+        self.live[i] = 0
+        self.liveCount -= 1
+        self.yes[i] = self.no[i] = self.unconfirmedCounts[i] = self.confirmedCounts[i] = 0
+        self.workers[i] = None
+    def assign(self, task, worker):
+        i = self._index(task)
+        index = self.workerToIndex.get(worker)
+        if index is None:
+            index = self.workerToIndex[worker] = len(self.workerToIndex)
+        workers = self.workers[i]
+        if workers is None:
+            workers = self.workers[i] = array.array('i')
+        position = bisect.bisect_left(workers, 2 * index)
+        assert(position == len(workers) or workers[position] >> 1 != index)
+        workers.insert(position, 2 * index)
+        self.unconfirmedCounts[i] += 1
+    def confirm(self, task, worker):
+        i, position = self._findUnconfirmed(task, worker)
+        self.workers[i][position] += 1
+        self.unconfirmedCounts[i] -= 1
+        self.confirmedCounts[i] += 1
+    def abandon(self, task, worker):
+        i, position = self._findUnconfirmed(task, worker)
+        workers = self.workers[i]
+        del workers[position]
+        if len(workers) == 0:
+            self.workers[i] = None
+        self.unconfirmedCounts[i] -= 1
+    def isAssigned(self, task, worker):
+        """return whether the task has been assigned to the worker (confirmed or not)"""
+        return self._find(self._index(task), worker) is not None
+    def count(self, task):
+        i = self._index(task)
+        return self.unconfirmedCounts[i] + self.confirmedCounts[i]
+    def confirmedCount(self, task):
+        return self.confirmedCounts[self._index(task)]
+    def unconfirmedCount(self, task):
+        return self.unconfirmedCounts[self._index(task)]
+    def getAnswers(self, task):
+        """return (yes, no)"""
+        i = self._index(task)
+        return self.yes[i], self.no[i]
+    def setAnswers(self, task, yes, no):
+        i = self._index(task)
+        self.yes[i] = yes
+        self.no[i] = no
+
+    def _index(self, task):
+        if task not in self:
+            raise KeyError(task)
+        return task.id
+    def _find(self, i, worker):
+        """return the position of the worker in self.workers[i] or None"""
+        index = self.workerToIndex.get(worker)
+        workers = self.workers[i]
+        if index is None or workers is None:
+            return None
+        position = bisect.bisect_left(workers, 2 * index)
+        if position == len(workers) or workers[position] >> 1 != index:
+            return None
+        return position
+    def _findUnconfirmed(self, task, worker):
+        i = self._index(task)
+        position = self._find(i, worker)
+        if position is None or self.workers[i][position] & 1 == 1:
+            raise KeyError(worker)
+        return i, position
+
+class TaskIdMap:
+    """A compact replacement of a dict from tasks to ints >= 0 for tasks
+    with integer ids, kept in an array indexed by task id (-1 for the
+    missing tasks)"""
+    def __init__(self, size, typecode = 'q'):
+        self.values = array.array(typecode, [-1]) * size
+        self.count = 0
+    def __len__(self):
+        return self.count
+    def __contains__(self, task):
+        return 0 <= task.id < len(self.values) and self.values[task.id] >= 0
+    def __getitem__(self, task):
+        if task not in self:
+            raise KeyError(task)
+        return self.values[task.id]
+    def __setitem__(self, task, value):
+        assert(value >= 0)
+        if task not in self:
+            self.count += 1
+        self.values[task.id] = value
+    def __delitem__(self, task):
+        if task not in self:
+            raise KeyError(task)
+        self.values[task.id] = -1
+        self.count -= 1
+    def get(self, task, default = None):
+        return self.values[task.id] if task in self else default
+
+class TaskIdList:
+    """A compact replacement of a list of tasks (or None) for tasks with
+    integer ids, kept as an array of the ids. The tasks are looked up in
+    `tasks` (see _taskLookup())."""
+    def __init__(self, tasks, items = ()):
+        self.tasks = tasks
+        self.ids = array.array('q', (-1 if x is None else x.id for x in items))
+    def __len__(self):
+        return len(self.ids)
+    def __getitem__(self, i):
+        id = self.ids[i]
+        return None if id < 0 else self.tasks[id]
+    def __setitem__(self, i, task):
+        self.ids[i] = -1 if task is None else task.id
+    def append(self, task):
+        self.ids.append(-1 if task is None else task.id)
+
+def _taskLookup(generator):
+    """return a sequence whose item i is the task of id i of the generator
+    (id_to_task of GeneralGenerator, which may build the tasks on demand)"""
+    tasks = getattr(generator, 'id_to_task', None)
+    if tasks is None:
+        tasks = []
+        for task in generator:
+            if task.id >= len(tasks):
+                tasks.extend([None] * (task.id + 1 - len(tasks)))
+            tasks[task.id] = task
+    return tasks
 
 class SimpleAssigner(BaseAssigner):
-    """Assign tasks and guarantee a worker never receive the same task twice."""
-    def __init__(self, duplicate = 1):
+    """Assign tasks and guarantee a worker never receive the same task twice.
+
+    The active tasks are kept in the order they become active. Each of them
+    has a sequence number, and a task reactivated by abandon() gets a new one
+    at the end, so assign() returns the first active task (in that order)
+    which the worker has not received. To find it without scanning the
+    tasks,
+
+    * the sequence numbers of the tasks no longer active are skipped by a
+      union-find (`nextSeq`), and
+    * every active task before `workerToSeq[workerId]` has been received by
+      the worker, so the search starts from there.
+
+    The assignments are kept in an AssignInfoDict, or in an AssignInfoTable
+    if compact is True, in which case seqTasks and task_to_seq are a
+    TaskIdList and a TaskIdMap, so no dict or list entry is kept per task."""
+    def __init__(self, duplicate = 1, compact = False):
         self.duplicate = duplicate
-        pass
+        self.compact = compact
     def link(self, generator):
         self.generator = generator
-        self.task_to_assignInfo = {task : AssignInfo() for task in generator}
-        self.inactive_task_to_assignInfo = {}
+        self.assignInfos = (AssignInfoTable if self.compact else AssignInfoDict)(generator)
+        # the tasks assigned `duplicate` times which are not finished
+        self.inactiveTasks = set()
+        # seqTasks[seq] is the active task of sequence number seq or None
+        if self.compact:
+            tasks = _taskLookup(generator)
+            self.seqTasks = TaskIdList(tasks, generator)
+            self.task_to_seq = TaskIdMap(len(tasks))
+        else:
+            self.seqTasks = list(generator)
+            self.task_to_seq = {}
+        for seq in range(len(self.seqTasks)):
+            self.task_to_seq[self.seqTasks[seq]] = seq
+        # nextSeq[seq] leads to the lowest active sequence number >= seq, or
+        # len(self.seqTasks) if there is not any
+        self.nextSeq = array.array('q', range(len(self.seqTasks) + 1))
+        self.workerToSeq = {}
     def assign(self, workerId):
-        if len(self.task_to_assignInfo) == 0:
-            if len(self.inactive_task_to_assignInfo) == 0:
+        if len(self.task_to_seq) == 0:
+            if len(self.inactiveTasks) == 0:
                 raise RunOutOfAllTask
             raise RunOutOfActiveTask
         else:
-            for task, assignInfo in self.task_to_assignInfo.items():
-                if workerId not in assignInfo:
+            seq = self._findSeq(self.workerToSeq.get(workerId, 0))
+            while seq < len(self.seqTasks):
+                task = self.seqTasks[seq]
+                if not self.assignInfos.isAssigned(task, workerId):
                     break
+                seq = self._findSeq(seq + 1)
             else:
+                self.workerToSeq[workerId] = seq
                 return None
-            assignInfo.assign(workerId)
-            if len(assignInfo) == self.duplicate:
+            self.workerToSeq[workerId] = seq + 1
+            self.assignInfos.assign(task, workerId)
+            if self.assignInfos.count(task) == self.duplicate:
                 # inactive the task
-                self.inactive_task_to_assignInfo[task] = assignInfo
-                del self.task_to_assignInfo[task]
+                self.inactiveTasks.add(task)
+                del self.task_to_seq[task]
+                self.seqTasks[seq] = None
+                self.nextSeq[seq] = seq + 1
             return task
     def update(self, workerId, task, label):
-        if task in self.task_to_assignInfo:
-            self.task_to_assignInfo[task].confirm(workerId)
-        else:
-            self.inactive_task_to_assignInfo[task].confirm(workerId)
-            if self.inactive_task_to_assignInfo[task].confirmedCount() == self.duplicate:
-                del self.inactive_task_to_assignInfo[task]
+        if task not in self.task_to_seq and task not in self.inactiveTasks:
+            raise KeyError(task)
+        self.assignInfos.confirm(task, workerId)
+        if task in self.inactiveTasks and self.assignInfos.confirmedCount(task) == self.duplicate:
+            self.inactiveTasks.remove(task)
+            del self.assignInfos[task]
     def abandon(self, workerId, task):
-        if task in self.inactive_task_to_assignInfo:
+        if task in self.inactiveTasks:
             # reactive the task
-            self.task_to_assignInfo[task] = self.inactive_task_to_assignInfo[task]
-            del self.inactive_task_to_assignInfo[task]
-        self.task_to_assignInfo[task].abandon(workerId)
+            self.inactiveTasks.remove(task)
+            # the end of nextSeq becomes the new sequence number
+            self.task_to_seq[task] = len(self.seqTasks)
+            self.seqTasks.append(task)
+            self.nextSeq.append(len(self.seqTasks))
+        elif task not in self.task_to_seq:
+            raise KeyError(task)
+        self.assignInfos.abandon(task, workerId)
+        seq = self.task_to_seq[task]
+        if seq < self.workerToSeq.get(workerId, 0):
+            self.workerToSeq[workerId] = seq
+    def _findSeq(self, seq):
+        """return the lowest active sequence number >= seq (len(self.seqTasks) if there is not any)"""
+        nextSeq = self.nextSeq
+        while nextSeq[seq] != seq:
+            # path halving
+            nextSeq[seq] = nextSeq[nextSeq[seq]]
+            seq = nextSeq[seq]
+        return seq
 
 class SimpleAssigner2(BaseAssigner):
     def __init__(self, duplicate = 1):
@@ -81,15 +323,75 @@ class SimpleAssigner2(BaseAssigner):
 
 
 
-from . import crowdscreen
+from . import crowdscreen, strategycache
+
+class TaskBuckets:
+    """The tasks of StrategyAssigner bucketed by the number of times they can still be assigned
+
+    The entries of a bucket are appended in the order the tasks enter it,
+    each with a stamp from a counter. An entry is stale once its task leaves
+    the bucket (`task_to_stamp` keeps the stamp of the current entry of each
+    task), and the stale entries are dropped when they outnumber the others.
+    As the stamps increase, a search can start from any stamp by bisection
+    (see find()).
+
+    newList() returns an empty list for the tasks of a bucket and
+    task_to_stamp is a dict or a TaskIdMap."""
+    def __init__(self, bucketCount, newList = list, task_to_stamp = None):
+        self.newList = newList
+        self.tasks = [newList() for i in range(bucketCount)]
+        self.stamps = [array.array('q') for i in range(bucketCount)]
+        self.liveCounts = [0] * bucketCount
+        self.task_to_stamp = {} if task_to_stamp is None else task_to_stamp
+        self.nextStamp = 0
+
+    def __len__(self):
+        return len(self.task_to_stamp)
+
+    def add(self, task, left):
+        self.tasks[left].append(task)
+        self.stamps[left].append(self.nextStamp)
+        self.task_to_stamp[task] = self.nextStamp
+        self.nextStamp += 1
+        self.liveCounts[left] += 1
+
+    def remove(self, task, left):
+        del self.task_to_stamp[task]
+        self.liveCounts[left] -= 1
+        if len(self.stamps[left]) > 2 * self.liveCounts[left] + 32:
+            tasks, stamps = self.tasks[left], self.stamps[left]
+            live = [i for i in range(len(stamps)) if self.task_to_stamp.get(tasks[i]) == stamps[i]]
+            self.tasks[left] = self.newList()
+            for i in live:
+                self.tasks[left].append(tasks[i])
+            self.stamps[left] = array.array('q', (stamps[i] for i in live))
+
+    def find(self, left, cursor, accept):
+        """return (task, cursor) where task is the first task (in the order
+        of entering the bucket) with a stamp >= cursor such that
+        accept(task), or None, and every task of the bucket before the
+        returned cursor is not accepted"""
+        tasks, stamps = self.tasks[left], self.stamps[left]
+        task_to_stamp = self.task_to_stamp
+        for i in range(bisect.bisect_left(stamps, cursor), len(stamps)):
+            task = tasks[i]
+            if task_to_stamp.get(task) == stamps[i] and accept(task):
+                return task, stamps[i]
+        return None, self.nextStamp
+
 class BaseStrategyAssigner(BaseAssigner):
-    def __init__(self, t = None, m = None, s = None, e0 = None, e1 = None, strategyGrid = None, verbose = False):
-        '''If strategyGrid is given, other parameters are ignored'''
+    def __init__(self, t = None, m = None, s = None, e0 = None, e1 = None, strategyGrid = None, verbose = False, cache = None):
+        '''If strategyGrid is given, other parameters are ignored
+
+        The strategy is looked up in `cache` (a strategycache.StrategyCache,
+        strategycache.defaultCache if None) before being calculated.'''
         if strategyGrid:
             self.strategy = None
             self.strategyGrid = strategyGrid
         else:
-            self.strategy = crowdscreen.getBestLadderStrategy(t, m, s, e0, e1)
+            if cache is None:
+                cache = strategycache.defaultCache
+            self.strategy = cache.get(t, m, s, e0, e1)
             self.strategyGrid = self.strategy.grid
         if self.strategyGrid[0][0] == crowdscreen.PASS or self.strategyGrid[0][0] == crowdscreen.FAIL:
             raise StrategyStopAtOrigin(self.strategyGrid[0][0])
@@ -116,29 +418,78 @@ class BaseStrategyAssigner(BaseAssigner):
                 raise ValueError('Only support 2-label tasks')
 
 class StrategyAssigner(BaseStrategyAssigner):
+    """An assigner use crowdscreen strategy and interface assign()
+
+    The active tasks are bucketed by the number of times they can still be
+    assigned (`task_to_left`, the steps to the nearest terminating point
+    minus the assignments not answered yet), see TaskBuckets. If priority
+    is "closest", the buckets are searched from the task closest to the
+    termination, which finishes the tasks sooner; if it is "farthest", from
+    the task farthest from the termination. Within a bucket, the tasks are
+    searched in the order they entered it.
+
+    A task keeps its assignment to a worker while it stays in a bucket (an
+    abandoned task moves to another bucket), so the search of a worker in a
+    bucket starts after the tasks it skipped last time
+    (`workerToCursors[workerId][left]`). Each entry of a bucket is skipped
+    at most once per worker, so the cost of assign() does not grow with
+    the number of tasks the worker has received.
+
+    The assignments and the answer counts are kept in an AssignInfoDict, or
+    in an AssignInfoTable if compact is True, in which case task_to_left
+    and the buckets are kept in TaskIdMap and TaskIdList arrays too."""
+    def __init__(self, *args, priority = 'closest', compact = False, **kwargs):
+        if priority not in ['closest', 'farthest']:
+            raise ValueError('Unsupported priority value ("{}")'.format(priority))
+        self.priority = priority
+        self.compact = compact
+        BaseStrategyAssigner.__init__(self, *args, **kwargs)
+
     def link(self, generator):
-        BaseStrategyAssigner.link(self, generator)
-        self.task_to_yes_no_assignInfo = {t : [0, 0, AssignInfo()] for t in self.activeTasks}
+        self.generator = generator
+        self.answerList = [] # final answers
+        self.assignInfos = (AssignInfoTable if self.compact else AssignInfoDict)(generator)
+        maxSteps = max(max(x) for x in self.stepsToNearestTermPoint)
+        # the active tasks, i.e. the tasks that can be assigned more times
+        if self.compact:
+            tasks = _taskLookup(generator)
+            self.buckets = TaskBuckets(maxSteps + 1, lambda : TaskIdList(tasks), TaskIdMap(len(tasks)))
+            self.task_to_left = TaskIdMap(len(tasks), 'i')
+        else:
+            self.buckets = TaskBuckets(maxSteps + 1)
+            self.task_to_left = {}
+        if self.priority == 'closest':
+            self.bucketOrder = list(range(1, maxSteps + 1))
+        else:
+            self.bucketOrder = list(range(maxSteps, 0, -1))
+        self.workerToCursors = {}
+        for task in generator:
+            if task.labelCount != 2:
+                raise ValueError('Only support 2-label tasks')
+            self._setLeft(task, self.stepsToNearestTermPoint[0][0])
 
     def assign(self, workerId):
-        if len(self.task_to_yes_no_assignInfo) == 0:
+        if len(self.assignInfos) == 0:
             raise RunOutOfAllTask
-        elif len(self.activeTasks) == 0:
+        elif len(self.buckets) == 0:
             raise RunOutOfActiveTask
         else:
-            for task in self.activeTasks:
-                assignInfo = self.task_to_yes_no_assignInfo[task][-1]
-                if workerId not in assignInfo:
+            cursors = self.workerToCursors.get(workerId)
+            if cursors is None:
+                cursors = self.workerToCursors[workerId] = array.array('q', bytes(8 * len(self.buckets.stamps)))
+            accept = lambda task : not self.assignInfos.isAssigned(task, workerId)
+            for left in self.bucketOrder:
+                task, cursors[left] = self.buckets.find(left, cursors[left], accept)
+                if task is not None:
                     break
             else:
                 return None
-            assignInfo.assign(workerId)
-            if not self.isActive(task):
-                self.activeTasks.remove(task)
+            self.assignInfos.assign(task, workerId)
+            self._setLeft(task, self.task_to_left[task] - 1)
             return task
 
     def update(self, workerId, task, label):
-        yes, no, assignInfo = self.task_to_yes_no_assignInfo[task]
+        yes, no = self.assignInfos.getAnswers(task)
         if label == 0:
             no += 1
         else:
@@ -150,29 +501,41 @@ class StrategyAssigner(BaseStrategyAssigner):
             raise ValueError("Reach UNREACHABLE node")
         if state == crowdscreen.PASS:
             self.answerList.append(SimpleAnswerWithLabelCount(task, 1, yes, no))
-            del self.task_to_yes_no_assignInfo[task]
-            assert(task not in self.activeTasks)
+            del self.assignInfos[task]
+            assert(self.task_to_left[task] == 0)
+            del self.task_to_left[task]
         elif state == crowdscreen.FAIL:
             self.answerList.append(SimpleAnswerWithLabelCount(task, 0, yes, no))
-            del self.task_to_yes_no_assignInfo[task]
-            assert(task not in self.activeTasks)
+            del self.assignInfos[task]
+            assert(self.task_to_left[task] == 0)
+            del self.task_to_left[task]
         else: # conn
-            self.task_to_yes_no_assignInfo[task][0] = yes
-            self.task_to_yes_no_assignInfo[task][1] = no
-            assignInfo.confirm(workerId)
-            if self.isActive(task):
-                self.activeTasks.add(task)
+            self.assignInfos.setAnswers(task, yes, no)
+            self.assignInfos.confirm(task, workerId)
+            self._setLeft(task, self.stepsToNearestTermPoint[no][yes] - self.assignInfos.unconfirmedCount(task))
 
     def abandon(self, workerId, task):
-        self.task_to_yes_no_assignInfo[task][-1].abandon(workerId)
-        self.activeTasks.add(task)
+        self.assignInfos.abandon(task, workerId)
+        self._setLeft(task, self.task_to_left[task] + 1)
 
     def isActive(self, task):
-        yes, no, assignInfo = self.task_to_yes_no_assignInfo[task]
-        left = self.stepsToNearestTermPoint[no][yes] - len(assignInfo.unconfirmedWorkers)
+        yes, no = self.assignInfos.getAnswers(task)
+        left = self.stepsToNearestTermPoint[no][yes] - self.assignInfos.unconfirmedCount(task)
         assert(left >= 0)
         return left > 0
 
+    def _setLeft(self, task, left):
+        """move the task to the bucket of `left`"""
+        assert(left >= 0)
+        oldLeft = self.task_to_left.get(task, 0)
+        if oldLeft == left:
+            return
+        if oldLeft > 0:
+            self.buckets.remove(task, oldLeft)
+        self.task_to_left[task] = left
+        if left > 0:
+            self.buckets.add(task, left)
+
 class StrategyAssigner2(BaseStrategyAssigner):
     """An assigner use crowdscreen strategy and interface assign2()"""
     def link(self, generator):
@@ -225,3 +588,19 @@ class StrategyAssigner2(BaseStrategyAssigner):
         yes, no, active = self.task_to_yes_no_active[task]
         steps = self.stepsToNearestTermPoint[no][yes]
         return steps - active
+
+
+
+#### memory benchmark: AssignInfoDict (compact = False) vs. AssignInfoTable (compact = True)
+#import tracemalloc
+#from .generator import GeneralGenerator
+#gen = GeneralGenerator(10**6, 2)
+#for compact in [False, True]:
+#    for assigner in [SimpleAssigner(5, compact = compact), StrategyAssigner(0.05, 12, 0.5, 0.2, 0.2, compact = compact)]:
+#        tracemalloc.start()
+#        assigner.link(gen)
+#        for i in range(10**5):
+#            task = assigner.assign(i % 50)
+#            assigner.update(i % 50, task, i % 2)
+#        print('{}(compact = {}): {:.1f} MB'.format(type(assigner).__name__, compact, tracemalloc.get_traced_memory()[0] / 2**20))
+#        tracemalloc.stop()
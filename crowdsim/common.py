@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+import collections
 from collections import namedtuple
 
 SimpleTask = namedtuple('SimpleTask', 'id, labelCount, trueLabel')
@@ -20,9 +21,17 @@ def toCallable(obj):
         return obj
     return lambda x: obj
 
-import random, bisect
+import random, bisect, array
+try:
+    import numpy
+except ImportError:
+    numpy = None
 class WeightedRandom:
-    """Return a random integer based on the weights"""
+    """Return a random integer based on the weights
+
+    The draws use an alias table (Vose's method), so each of them takes a
+    single random.random() call whatever the number of weights. sample(n)
+    returns n draws at once."""
     def __init__(self, weights):
         """Init...
 
@@ -38,13 +47,44 @@ class WeightedRandom:
             pass
         self.rangeList = rangeList
         self.searchRange = rangeList[-1]
-    def __call__(self):
-        # Generate a random number x in range [0, self.search range], if
-        # workerRange[i-1] < x <= workerRange[i], then return i
+        if self.searchRange <= 0:
+            raise ValueError('The sum of the weights should be positive')
 
-        # !! Do not use bisect_right() because random.uniform(0, b) may return
-        # b, in this case bisect_right() will return `len(self.rangeList)`!
-        return bisect.bisect_left(self.rangeList, random.uniform(0, self.searchRange))
+        # the alias table: draw i uniformly, then return i with probability
+        # prob[i] or alias[i] otherwise
+        n = len(rangeList)
+        scaled = [(b - a) * n / self.searchRange for a, b in zip([0] + rangeList, rangeList)]
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+        small = [i for i, x in enumerate(scaled) if x < 1]
+        large = [i for i, x in enumerate(scaled) if x >= 1]
+        while small and large:
+            s = small.pop()
+            l = large[-1]
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1 - scaled[s]
+            if scaled[l] < 1:
+                small.append(large.pop())
+        self._arrays = None
+    def __call__(self):
+        # the integer part of x is the index and the fractional part decides
+        # between it and its alias
+        x = random.random() * len(self.prob)
+        i = int(x)
+        return i if x - i < self.prob[i] else self.alias[i]
+    def sample(self, n):
+        """return an array of n draws (a NumPy array if NumPy is available,
+        drawn by a NumPy generator seeded from `random`)"""
+        if numpy is None:
+            return array.array('q', (self() for i in range(n)))
+        if self._arrays is None:
+            self._arrays = (numpy.random.default_rng(random.getrandbits(64)),
+                    numpy.array(self.prob), numpy.array(self.alias, dtype = numpy.int64))
+        rng, prob, alias = self._arrays
+        x = rng.random(n) * len(prob)
+        i = x.astype(numpy.int64)
+        return numpy.where(x - i < prob[i], i, alias[i])
 
 def maxIndex(l):
     mi = 0
@@ -55,6 +95,99 @@ def maxIndex(l):
             mi = i
     return mi
 
+class AnswerTable:
+    """Answers kept as three columns of the same length: workerIds, taskIds
+    and labels. id_to_task maps a task id to the task (e.g.
+    GeneralGenerator.id_to_task).
+
+    A new table keeps the columns in compact int arrays (4 bytes per column
+    per answer), so the worker ids and the labels should be ints. The columns
+    can also be given as other sequences or NumPy arrays. Iterating the table yields Answer
+    namedtuples, so it can be used where a list of Answer is expected; the
+    deducers and the evaluating functions read the columns directly."""
+    def __init__(self, id_to_task = None, workerIds = None, taskIds = None, labels = None):
+        if id_to_task is None:
+            id_to_task = {}
+            workerIds = array.array('i')
+            taskIds = array.array('i')
+            labels = array.array('i')
+        assert(len(workerIds) == len(taskIds) == len(labels))
+        self.id_to_task = id_to_task
+        self.workerIds = workerIds
+        self.taskIds = taskIds
+        self.labels = labels
+
+    @classmethod
+    def fromAnswers(cls, answers):
+        table = cls()
+        for a in answers:
+            table.append(a)
+        return table
+
+    def append(self, answer):
+        """append an Answer"""
+        if not isinstance(self.id_to_task, dict) or not isinstance(self.labels, array.array):
+            self._toArrays()
+        task = answer.task
+        self.id_to_task.setdefault(task.id, task)
+        self.workerIds.append(answer.workerId)
+        self.taskIds.append(task.id)
+        self.labels.append(answer.label)
+    def __len__(self):
+        return len(self.labels)
+    def __getitem__(self, i):
+        return Answer(_toInt(self.workerIds[i]), self.id_to_task[_toInt(self.taskIds[i])], _toInt(self.labels[i]))
+    def __iter__(self):
+        id_to_task = self.id_to_task
+        for workerId, taskId, label in zip(_toList(self.workerIds), _toList(self.taskIds), _toList(self.labels)):
+            yield Answer(workerId, id_to_task[taskId], label)
+    def columns(self):
+        """return (workerIds, taskIds, labels) as sequences of python ints"""
+        return _toList(self.workerIds), _toList(self.taskIds), _toList(self.labels)
+    def arrays(self):
+        """return (workerIds, taskIds, labels) as NumPy int64 arrays (NumPy is required)"""
+        return tuple(numpy.asarray(x).astype(numpy.int64) for x in (self.workerIds, self.taskIds, self.labels))
+    def taskArray(self, field):
+        """return a NumPy array a where a[taskId] is the field (e.g.
+        "trueLabel") of the task (NumPy is required)"""
+        if hasattr(self.id_to_task, 'taskArray'):
+            # e.g. generator.TaskSequence, whose tasks are not built
+            return self.id_to_task.taskArray(field)
+        if isinstance(self.id_to_task, dict):
+            size = max(self.id_to_task) + 1 if self.id_to_task else 0
+            a = numpy.zeros(size, dtype = numpy.int64)
+            for taskId, task in self.id_to_task.items():
+                a[taskId] = getattr(task, field)
+            return a
+        return numpy.array([getattr(task, field) for task in self.id_to_task], dtype = numpy.int64)
+
+    def _toArrays(self):
+        # tables built from other columns (e.g. NumPy arrays) are copied
+        # before being appended
+        self.id_to_task = {x : self.id_to_task[x] for x in dict.fromkeys(_toList(self.taskIds))}
+        self.workerIds = array.array('i', _toList(self.workerIds))
+        self.taskIds = array.array('i', _toList(self.taskIds))
+        self.labels = array.array('i', _toList(self.labels))
+
+def asAnswerTable(answers):
+    """return the AnswerTable behind answers (an AnswerTable or a worker
+    pool keeping one as answerList) or None"""
+    if isinstance(answers, AnswerTable):
+        return answers
+    answerList = getattr(answers, 'answerList', None)
+    if isinstance(answerList, AnswerTable):
+        return answerList
+    return None
+
+def _toList(column):
+    # NumPy arrays yield NumPy scalars, convert them to python ints
+    if isinstance(column, array.array) or not hasattr(column, 'tolist'):
+        return column
+    return column.tolist()
+
+def _toInt(x):
+    return x.item() if hasattr(x, 'item') else x
+
 # Exceptions
 class FailToGetStrategy(Exception):
     pass
@@ -65,8 +65,7 @@ class strategy:
         """check the grid and ensure unreachable nodes are labeled correctly.
         
         If the strategy is not terminating, this function will raise `NotTerminating` instead of `ViolateM`"""
-        visitedGrid = self._getGrid(False)
-        self._checkGrid_visit(0, 0, visitedGrid)
+        visitedGrid = _reachGrid(self.grid, self.m + 1, NotTerminating)[0]
         for x in range(self.m + 1):
             for y in range(self.m + 1):
                 if visitedGrid[x][y] == False:
@@ -74,20 +73,6 @@ class strategy:
                 elif x + y > self.m:
                     raise ViolateM
 
-    def _checkGrid_visit(self, x, y, visitedGrid):
-        if x > self.m or y > self.m:
-            raise NotTerminating
-        if visitedGrid[x][y] == True:
-            return
-        visitedGrid[x][y] = True
-        gridValue = self.grid[x][y]
-        if gridValue == UNREACHABLE:
-            raise MeetUnreachableNode
-        if gridValue == CONN: # continue
-            self._checkGrid_visit(x + 1, y, visitedGrid)
-            self._checkGrid_visit(x, y + 1, visitedGrid)
-
-
     def _getGrid(self, initValue = 0):
         return [ [initValue for i in range(self.m + 1)] for x in range(self.m + 1) ]
     def _calcP(self): # should call checkGrid() before call this function
@@ -110,6 +95,202 @@ class strategy:
                         self.p0[x][y] = p0_l*(1 - self.e0)+ p0_d*self.e0
                         self.p1[x][y] = p1_l*self.e1 + p1_d*(1-self.e1)
 
+class incrementalStrategy(strategy):
+    """A strategy whose grid can be changed after calc().
+
+    Change the grid by setPoints() instead of writing `grid` directly.
+    calc() then updates reachability, p0/p1, e, c and eEach only for the
+    points at the upper right of the changed points (x >= X and y >= Y for
+    some changed point (X, Y)), which are the only points that can be
+    affected. e and c are then summed over the terminating points in the
+    order of strategy.calc(), so they are exactly the same.
+
+    `grid` has the same meaning as for strategy (unreachable points are
+    labeled UNREACHABLE after calc()), while the values set by the user are
+    kept in `design`."""
+    def __init__(self, m, s, e0, e1, gridInitValue = CONN):
+        strategy.__init__(self, m, s, e0, e1, gridInitValue)
+        self.design = self._getGrid(gridInitValue)
+        self.reached = self._getGrid(False)
+        self.p0 = self._getGrid(0)
+        self.p1 = self._getGrid(0)
+        self.e = self.c = 0
+        self.eEach = {}
+        # number of reached points which make checkGrid() raise the exceptions
+        self.violateMCount = self.notTerminatingCount = self.unreachableCount = 0
+        self.changedPoints = [(0, 0)]
+
+    def setPoints(self, points, value):
+        """set the value of the points in the grid"""
+        for x, y in points:
+            if self.design[x][y] != value:
+                self.design[x][y] = value
+                self.changedPoints.append((x, y))
+
+    def calc(self):
+        if self.changedPoints:
+            self._update()
+        if self.unreachableCount or self.notTerminatingCount:
+            # the exception strategy.checkGrid() raises
+            _raiseFirstError(self.grid, self.m + 1, NotTerminating)
+        if self.violateMCount:
+            raise ViolateM
+        self.e = self.c = 0
+        for x, y in sorted(self.eEach):
+            p0, p1 = self.p0[x][y], self.p1[x][y]
+            self.e += p0 if self.grid[x][y] == PASS else p1
+            self.c += (x + y) * (p0 + p1)
+
+    def checkGrid(self):
+        self.calc()
+
+    def _update(self):
+        # the affected points of column x are those with y >= columnStart[x]
+        columnStart = [self.m + 1] * (self.m + 1)
+        for x, y in self.changedPoints:
+            columnStart[x] = min(columnStart[x], y)
+        for x in range(1, self.m + 1):
+            columnStart[x] = min(columnStart[x], columnStart[x - 1])
+        self.changedPoints = []
+
+        design, reached, p0, p1 = self.design, self.reached, self.p0, self.p1
+        for x in range(self.m + 1):
+            for y in range(columnStart[x], self.m + 1):
+                self._count(x, y, -1)
+                if x == y == 0:
+                    reached[0][0] = True
+                    p0[0][0] = 1 - self.s
+                    p1[0][0] = self.s
+                else:
+                    p0_l = p0_d = p1_l = p1_d = 0 # l -> left, d -> down
+                    left = x > 0 and reached[x-1][y] and design[x-1][y] == CONN
+                    down = y > 0 and reached[x][y-1] and design[x][y-1] == CONN
+                    if left:
+                        p0_l = p0[x-1][y]
+                        p1_l = p1[x-1][y]
+                    if down:
+                        p0_d = p0[x][y-1]
+                        p1_d = p1[x][y-1]
+                    reached[x][y] = left or down
+                    p0[x][y] = p0_l*(1 - self.e0)+ p0_d*self.e0
+                    p1[x][y] = p1_l*self.e1 + p1_d*(1-self.e1)
+                self.grid[x][y] = design[x][y] if reached[x][y] else UNREACHABLE
+                self._count(x, y, 1)
+
+    def _count(self, x, y, sign):
+        """add (sign == 1) or remove (sign == -1) the contribution of (x, y)"""
+        if not self.reached[x][y]:
+            return
+        value = self.grid[x][y]
+        if value == UNREACHABLE:
+            self.unreachableCount += sign
+        if x + y > self.m:
+            self.violateMCount += sign
+        if value == CONN and (x == self.m or y == self.m):
+            self.notTerminatingCount += sign
+        if value == PASS or value == FAIL:
+            p0, p1 = self.p0[x][y], self.p1[x][y]
+            pReach = p0 + p1
+            if sign == 1:
+                self.eEach[(x, y)] = (p0 if value == PASS else p1) / pReach
+            else:
+                del self.eEach[(x, y)]
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class arrayStrategy(strategy):
+    """A strategy stored in NumPy arrays: an int8 grid and float64 p0/p1.
+
+    Reachability and p0/p1 are computed one anti-diagonal (x + y = k) at a
+    time with vector operations, and e/c are computed by masked reductions.
+    The arithmetic and the summing order are those of strategy, so e, c,
+    eEach and the grid are exactly the same. If NumPy is not installed, this
+    class falls back to the list based strategy."""
+    def calc(self):
+        if numpy is None:
+            return strategy.calc(self)
+        if not self.e or not self.c:
+            self.checkGrid()
+            self._calcP()
+            passMask = self.grid == PASS
+            termMask = passMask | (self.grid == FAIL)
+            pReach = self.p0 + self.p1
+            error = numpy.where(passMask, self.p0, self.p1)
+            steps = numpy.add.outer(numpy.arange(self.m + 1), numpy.arange(self.m + 1))
+            # cumsum() adds the values one by one in the same order as
+            # strategy.calc(), so the rounding is the same too
+            self.e = self._sum(error[termMask])
+            self.c = self._sum((steps * pReach)[termMask])
+            eEach = (error[termMask] / pReach[termMask]).tolist()
+            points = zip(*(x.tolist() for x in numpy.nonzero(termMask)))
+            self.eEach = dict(zip(points, eEach))
+
+    def checkGrid(self):
+        if numpy is None:
+            return strategy.checkGrid(self)
+        m = self.m
+        grid = self.grid
+        visitedGrid = numpy.zeros((m + 1, m + 1), dtype = bool)
+        visitedGrid[0, 0] = True
+        for k in range(2 * m + 1):
+            xs, ys = self._diagonal(k)
+            visited = visitedGrid[xs, ys]
+            values = grid[xs, ys]
+            conn = visited & (values == CONN)
+            if (visited & (values == UNREACHABLE)).any() or (conn & ((xs == m) | (ys == m))).any():
+                # which of MeetUnreachableNode and NotTerminating is raised
+                # depends on the order of the depth first search
+                listStrategy = strategy(m, self.s, self.e0, self.e1)
+                listStrategy.grid = grid.tolist()
+                listStrategy.checkGrid()
+            visitedGrid[xs[conn] + 1, ys[conn]] = True
+            visitedGrid[xs[conn], ys[conn] + 1] = True
+        grid[~visitedGrid] = UNREACHABLE
+        steps = numpy.add.outer(numpy.arange(m + 1), numpy.arange(m + 1))
+        if (visitedGrid & (steps > m)).any():
+            raise ViolateM
+
+    def _getGrid(self, initValue = 0):
+        if numpy is None:
+            return strategy._getGrid(self, initValue)
+        return numpy.full((self.m + 1, self.m + 1), initValue, dtype = numpy.int8)
+
+    def _calcP(self): # should call checkGrid() before call this function
+        if numpy is None:
+            return strategy._calcP(self)
+        if self.p0 is None or self.p1 is None:
+            m = self.m
+            self.p0 = p0 = numpy.zeros((m + 1, m + 1))
+            self.p1 = p1 = numpy.zeros((m + 1, m + 1))
+            p0[0, 0] = 1 - self.s
+            p1[0, 0] = self.s
+            conn = self.grid == CONN
+            for k in range(1, 2 * m + 1):
+                xs, ys = self._diagonal(k)
+                p0_l, p0_d, p1_l, p1_d = (numpy.zeros(len(xs)) for i in range(4)) # l -> left, d -> down
+                left = xs > 0
+                lx, ly = xs[left] - 1, ys[left]
+                p0_l[left] = numpy.where(conn[lx, ly], p0[lx, ly], 0)
+                p1_l[left] = numpy.where(conn[lx, ly], p1[lx, ly], 0)
+                down = ys > 0
+                dx, dy = xs[down], ys[down] - 1
+                p0_d[down] = numpy.where(conn[dx, dy], p0[dx, dy], 0)
+                p1_d[down] = numpy.where(conn[dx, dy], p1[dx, dy], 0)
+                p0[xs, ys] = p0_l*(1 - self.e0)+ p0_d*self.e0
+                p1[xs, ys] = p1_l*self.e1 + p1_d*(1-self.e1)
+
+    def _diagonal(self, k):
+        """return the indices (xs, ys) of the points on x + y = k"""
+        xs = numpy.arange(max(0, k - self.m), min(k, self.m) + 1)
+        return xs, k - xs
+
+    @staticmethod
+    def _sum(values):
+        return values.cumsum()[-1].item() if len(values) else 0
+
 import itertools
 class ladderGenerator:
     """This class iterates though all ladder start from y/x axis and ensures the last segment of the ladder is horizontal/vertical.
@@ -189,7 +370,90 @@ class ladderGenerator:
                     assert(r[-1][0] == self.dx and r[-1][1] + 1 == self.dy)
                 return r
 
-def getBestLadderStrategy(t, m, s, e0, e1):
+def getBestLadderStrategy(t, m, s, e0, e1, method = 'search', workers = None, epsilon = 0):
+    """Return the ladder strategy with the lowest cost c subject to e <= t.
+
+    method can be "search" (see ladderSearch), "enumerate" or "incremental"
+    (see enumerateBestLadderStrategy). All of them return the same strategy,
+    but only "search" is usable for large m. None is returned if no strategy
+    satisfies e <= t.
+
+    If workers > 1, the start points (x, 0) and (0, y) of the ladders are
+    split over a pool of `workers` processes. The result is the same as the
+    serial one.
+
+    If epsilon > 0 (method "search" only), the search skips every partial
+    ladder pair whose cost bound is not below c / (1 + epsilon), where c is
+    the cost of the best strategy found so far, so the returned strategy
+    costs at most (1 + epsilon) times the lowest cost. Its attribute `gap`
+    is the guaranteed upper bound of the difference between its c and the
+    lowest cost (0 if the strategy is exactly the best one)."""
+    if method not in ['search', 'enumerate', 'incremental']:
+        raise ValueError('Unsupported method value ("{}")'.format(method))
+    if epsilon < 0 or (epsilon > 0 and method != 'search'):
+        raise ValueError('Unsupported epsilon value ("{}") for method "{}"'.format(epsilon, method))
+    tempStrategy = _originStrategy(m, s, e0, e1)
+    if tempStrategy.e <= t:
+        # if this happen, tempStrategy mush be the best (lowest cost) stratyge
+        tempStrategy.gap = 0
+        return tempStrategy
+
+    if workers is None or workers <= 1:
+        best, lowerBound = _bestLadders(method, t, m, s, e0, e1, None, epsilon)
+    else:
+        import multiprocessing
+        chunks = _startPointChunks(m, 4 * workers)
+        # the lowest cost found so far, shared by the searches for pruning
+        sharedCost = multiprocessing.RawValue('d', float('inf'))
+        with multiprocessing.Pool(workers, _initWorker, (sharedCost,)) as pool:
+            results = pool.starmap(_bestLadders, [(method, t, m, s, e0, e1, x, epsilon) for x in chunks], chunksize = 1)
+        # ties of c are broken by the enumeration order, as the serial search
+        # does
+        best = min((x[0] for x in results if x[0] is not None), default = None)
+        lowerBound = min((x[1] for x in results), default = float('inf'))
+    if best is None:
+        return None
+    bestStrategy = _ladderStrategy(m, s, e0, e1, *best[1])
+    bestStrategy.calc()
+    bestStrategy.gap = max(0, best[0] - lowerBound)
+    return bestStrategy
+
+_sharedCost = None
+def _initWorker(sharedCost):
+    global _sharedCost
+    _sharedCost = sharedCost
+
+def _bestLadders(method, t, m, s, e0, e1, startPoints = None, epsilon = 0):
+    """return (best, lowerBound), where best is (c, (x, y, decX, decY,
+    upperLadder, lowerLadder)) of the best ladders found or None, and
+    lowerBound is the lowest cost bound of the ladders skipped by epsilon
+    (see ladderSearch)
+
+    Only the ladders starting from (x, 0) and (0, y), where (x, y) in
+    startPoints, are considered. Ties of c are broken by the enumeration
+    order."""
+    if method == 'search':
+        search = ladderSearch(t, m, s, e0, e1, startPoints, _sharedCost, epsilon)
+        return search.search(), search.lowerBound
+    return _enumerateLadders(t, m, s, e0, e1, startPoints, incremental = method == 'incremental'), float('inf')
+
+def _startPointChunks(m, chunkCount):
+    """split the start points (x, y) into at most chunkCount lists with similar numbers of ladder pairs"""
+    from math import comb
+    weights = {}
+    for x in range(1, m+1):
+        for y in range(1, m-x+2):
+            weights[(x, y)] = sum(comb(decX+decY-y, decX) * comb(decX+decY-x, decY)
+                    for decX in range(x, m+1) for decY in range(y, m - decX + 2))
+    # greedily put the heaviest start point to the lightest chunk
+    chunks = [[0, []] for i in range(min(chunkCount, len(weights)))]
+    for point in sorted(weights, key = lambda x: (-weights[x], x)):
+        chunk = min(chunks, key = lambda x: x[0])
+        chunk[0] += weights[point]
+        chunk[1].append(point)
+    return [sorted(x[1]) for x in chunks]
+
+def _originStrategy(m, s, e0, e1):
     # special strategy case: terminates at (0,0)
     tempStrategy = strategy(m, s, e0, e1)
     if s < 0.5:
@@ -197,16 +461,44 @@ def getBestLadderStrategy(t, m, s, e0, e1):
     else:
         tempStrategy.grid[0][0] = PASS
     tempStrategy.calc()
-    if tempStrategy.e <= t:
-        # if this happen, tempStrategy mush be the best (lowest cost) stratyge
-        return tempStrategy
-    bestStrategy = None
+    return tempStrategy
+
+def _ladderStrategy(m, s, e0, e1, x, y, decX, decY, upperLadder, lowerLadder):
+    """return the (uncalculated) strategy made of the ladders starting from
+    (0, y) and (x, 0) and meeting at the decision point (decX, decY)"""
+    tempStrategy = strategy(m, s, e0, e1)
+    for points in lowerLadder:
+        tempStrategy.grid[points[0]][points[1]] = FAIL
+    tempStrategy.grid[x][0] = FAIL
+    for points in upperLadder:
+        tempStrategy.grid[points[0]][points[1]] = PASS
+    tempStrategy.grid[0][y] = PASS
+    tempStrategy.grid[decX][decY] = PASS
+    return tempStrategy
+
+def enumerateBestLadderStrategy(t, m, s, e0, e1, incremental = False):
+    """Try every ladder pair from ladderGenerator and return the best one.
+
+    The number of pairs grows combinatorially (see calcLadderShapeCount), so
+    this is only usable for small m. If incremental is True, a single
+    incrementalStrategy is updated from one pair to the next instead of
+    building and calculating a new strategy for each pair."""
+    return getBestLadderStrategy(t, m, s, e0, e1, 'incremental' if incremental else 'enumerate')
+
+def _enumerateLadders(t, m, s, e0, e1, startPoints = None, incremental = False):
+    """see _bestLadders()"""
+    best = None
+    if incremental:
+        tempStrategy = incrementalStrategy(m, s, e0, e1)
+        points = {}
     # normal case: x > 0 and y > 0
     # in additional, decX >= x and decY >= y, where (decX, decY) is the decision point
     upper = ladderGenerator(ladderGenerator.UPPER_LADDER)
     lower = ladderGenerator(ladderGenerator.LOWER_LADDER)
     for x in range(1, m+1):
         for y in range(1, m-x+2): # x + y <= m + 1
+            if startPoints is not None and (x, y) not in startPoints:
+                continue
             for decX in range(x, m+1):
                 for decY in range(y, m - decX + 2): # decX + decY <= m + 1
                     upper.reset((0, y), (decX, decY))
@@ -214,14 +506,11 @@ def getBestLadderStrategy(t, m, s, e0, e1):
                         # restrict lower ladder so that it won't overlap upper ladder
                         lower.reset((x, 0), (decX, decY), upperLadder)
                         for lowerLadder in lower:
-                            tempStrategy = strategy(m, s, e0, e1)
-                            for points in lowerLadder:
-                                tempStrategy.grid[points[0]][points[1]] = FAIL
-                            tempStrategy.grid[x][0] = FAIL
-                            for points in upperLadder:
-                                tempStrategy.grid[points[0]][points[1]] = PASS
-                            tempStrategy.grid[0][y] = PASS
-                            tempStrategy.grid[decX][decY] = PASS
+                            ladders = (x, y, decX, decY, upperLadder, lowerLadder)
+                            if incremental:
+                                points = _applyLadders(tempStrategy, points, *ladders)
+                            else:
+                                tempStrategy = _ladderStrategy(m, s, e0, e1, *ladders)
                             try:
                                 # the stragety may violate the restriction of `m`
                                 tempStrategy.calc()
@@ -229,9 +518,285 @@ def getBestLadderStrategy(t, m, s, e0, e1):
                                 pass
                             else:
                                 if tempStrategy.e <= t:
-                                    if (bestStrategy is None) or (tempStrategy.c < bestStrategy.c):
-                                        bestStrategy = tempStrategy
-    return bestStrategy
+                                    if (best is None) or (tempStrategy.c < best[0]):
+                                        best = (tempStrategy.c, ladders)
+    return best
+
+def _applyLadders(tempStrategy, points, x, y, decX, decY, upperLadder, lowerLadder):
+    """change the incrementalStrategy from the ladders given by `points` (a
+    dict point -> value) to the new ones and return the new `points`"""
+    newPoints = {}
+    for point in lowerLadder:
+        newPoints[point] = FAIL
+    newPoints[(x, 0)] = FAIL
+    for point in upperLadder:
+        newPoints[point] = PASS
+    newPoints[(0, y)] = PASS
+    newPoints[(decX, decY)] = PASS
+    tempStrategy.setPoints([p for p in points if p not in newPoints], CONN)
+    tempStrategy.setPoints([p for p, v in newPoints.items() if v == PASS], PASS)
+    tempStrategy.setPoints([p for p, v in newPoints.items() if v == FAIL], FAIL)
+    return newPoints
+
+class ladderSearch:
+    """Branch and bound search for the best ladder strategy.
+
+    Instead of building every ladder pair, the upper and the lower ladders
+    are grown together, one anti-diagonal (x + y = k) at a time. Ladder pairs
+    sharing a prefix share the propagation of p0/p1 up to the end of the
+    prefix, and a prefix is dropped as soon as
+
+    * the two ladders can no longer meet at a decision point within m,
+    * a lower bound of e exceeds t, or
+    * a lower bound of c exceeds the cost of the best strategy found
+      (divided by 1 + epsilon in the approximate mode).
+
+    The bounds come from the best stopping policies that are not restricted
+    to ladders (see _boundTable).
+
+    p0/p1 are propagated with the same arithmetic as strategy._calcP() and e/c
+    are summed in the same order as strategy.calc(), and ties of c are broken
+    by the order of enumerateBestLadderStrategy(). So the returned strategy
+    is exactly the one enumerateBestLadderStrategy() returns if epsilon == 0.
+    Otherwise, no ladder pair skipped because of epsilon costs less than
+    lowerBound, the lowest cost bound of the skipped prefixes."""
+
+    # relative slack of the bounds, which are summed in a different order
+    TOLERANCE = 1e-9
+
+    def __init__(self, t, m, s, e0, e1, startPoints = None, sharedCost = None, epsilon = 0):
+        """if startPoints is not None, only the ladders starting from (x, 0)
+        and (0, y), where (x, y) in startPoints, are searched.
+
+        sharedCost can be a multiprocessing.Value shared by the searches of
+        other start points. It holds the lowest cost found by any of them and
+        is used for pruning too.
+
+        epsilon is the relative cost gap allowed, see getBestLadderStrategy()."""
+        self.t = t
+        self.m = m
+        self.s = s
+        self.e0 = e0
+        self.e1 = e1
+        self.startPoints = None if startPoints is None else set(startPoints)
+        self.sharedCost = sharedCost
+        self.epsilon = epsilon
+
+        # reach probabilities of a single path to (x, y), indexed by [k][x]
+        # where k = x + y
+        self.b0 = [[(1 - s) * (1 - e0)**x * e0**(k - x) for x in range(k + 1)] for k in range(m + 1)]
+        self.b1 = [[s * e1**x * (1 - e1)**(k - x) for x in range(k + 1)] for k in range(m + 1)]
+        self.errorBound = self._boundTable(0, 1)
+        lam = self._bestLagrangeMultiplier()
+        self.lambdas = [0] if lam == 0 else [0, lam / 2, lam, 2 * lam]
+        self.costBounds = [self._boundTable(1, x) for x in self.lambdas]
+
+    def run(self):
+        """return the best strategy or None"""
+        tempStrategy = _originStrategy(self.m, self.s, self.e0, self.e1)
+        if tempStrategy.e <= self.t:
+            tempStrategy.gap = 0
+            return tempStrategy
+        best = self.search()
+        if best is None:
+            return None
+        bestStrategy = _ladderStrategy(self.m, self.s, self.e0, self.e1, *best[1])
+        bestStrategy.calc()
+        bestStrategy.gap = max(0, best[0] - self.lowerBound)
+        return bestStrategy
+
+    def search(self):
+        """search the ladders only (no origin strategy), see _bestLadders()"""
+        # best = (c, (x, y, decX, decY, upperLadder, lowerLadder))
+        self.best = None
+        self.bestCost = float('inf')
+        self.lowerBound = float('inf')
+        self.terminals = [] # (x, y, label, p0, p1)
+        self.upperLadder = []
+        self.lowerLadder = []
+        self.x = self.y = None
+        if self.m > 0 and self.errorBound[0][0] <= self.t * (1 + self.TOLERANCE):
+            self._visit(0, -1, 1, [1 - self.s], [self.s], 0, 0)
+        return self.best
+
+    def _boundTable(self, costWeight, errorWeight):
+        """return table[k][x], the lower bound of (costWeight * c + errorWeight * e) per unit of reach probability at (x, k - x)
+
+        The bound is the value of the best policy which may stop (PASS or
+        FAIL) or continue at any point."""
+        m = self.m
+        value = [None] * (m + 1)
+        table = [None] * (m + 1)
+        for k in range(m, -1, -1):
+            value[k] = [0] * (k + 1)
+            table[k] = [0] * (k + 1)
+            for x in range(k + 1):
+                p0 = self.b0[k][x]
+                p1 = self.b1[k][x]
+                v = costWeight * k * (p0 + p1) + errorWeight * min(p0, p1)
+                if k < m:
+                    v = min(v, value[k + 1][x] + value[k + 1][x + 1])
+                value[k][x] = v
+                if p0 + p1 > 0:
+                    table[k][x] = v / (p0 + p1)
+        return table
+
+    def _bestLagrangeMultiplier(self):
+        """return the multiplier lam maximizing the Lagrangian lower bound of c at the origin (0 if it is not found)"""
+        def dual(lam):
+            return self._boundTable(1, lam)[0][0] - lam * self.t
+        if self.m == 0 or self.errorBound[0][0] > self.t:
+            return 0
+        low, high = 0, 1
+        while dual(2 * high) > dual(high):
+            high *= 2
+            if high > 1e12:
+                return 0
+        high *= 2
+        for i in range(40):
+            a = low + (high - low) / 3
+            b = high - (high - low) / 3
+            if dual(a) < dual(b):
+                low = a
+            else:
+                high = b
+        return (low + high) / 2
+
+    def _visit(self, k, u, l, q0, q1, e, c):
+        """grow the ladders from anti-diagonal k to k + 1
+
+        u and l are the x of the upper and the lower ladders on anti-diagonal
+        k. If the upper ladder has not started, u == -1; if the lower ladder
+        has not started, l == k + 1. q0/q1 are p0/p1 of the continuing
+        points (u + 1, ...), ..., (l - 1, ...). e and c are the partial
+        sums of the terminating points so far."""
+        m, t, n = self.m, self.t, k + 1
+        slack = 1 + self.TOLERANCE
+        approximate = self.epsilon > 0
+
+        # p0/p1 of the points on anti-diagonal n which may be reached
+        low, high = max(u, 0), min(l + 1, n)
+        p0 = {}
+        p1 = {}
+        for x in range(low, high + 1):
+            p0_l = p0_d = p1_l = p1_d = 0 # l -> left, d -> down
+            if u < x - 1 < l:
+                p0_l = q0[x - 1 - u - 1]
+                p1_l = q1[x - 1 - u - 1]
+            if u < x < l:
+                p0_d = q0[x - u - 1]
+                p1_d = q1[x - u - 1]
+            p0[x] = p0_l*(1 - self.e0)+ p0_d*self.e0
+            p1[x] = p1_l*self.e1 + p1_d*(1-self.e1)
+
+        # prefix sums of the bounds of the continuing points
+        errorSum = [0]
+        costSums = [[0] for x in self.lambdas]
+        for x in range(low, high + 1):
+            pReach = p0[x] + p1[x]
+            errorSum.append(errorSum[-1] + pReach * self.errorBound[n][x])
+            for costSum, table in zip(costSums, self.costBounds):
+                costSum.append(costSum[-1] + pReach * table[n][x])
+
+        children = []
+        for nu in (u, u + 1):
+            for nl in (l, l + 1):
+                if nl - nu - 1 > m - n:
+                    # the ladders cannot meet within m
+                    continue
+                lowerStarts = nl == n and l == k + 1
+                upperStarts = nu == 0 and u == -1
+                if self.startPoints is not None and (lowerStarts or upperStarts) and not self._canStart(
+                        n if lowerStarts else self.x, n if upperStarts else self.y, n):
+                    continue
+                ne, nc = e, c
+                terminals = []
+                if nu >= 0:
+                    ne += p0[nu]
+                    nc += n * (p0[nu] + p1[nu])
+                    terminals.append((nu, n - nu, PASS, p0[nu], p1[nu]))
+                if nl <= n:
+                    ne += p1[nl]
+                    nc += n * (p0[nl] + p1[nl])
+                    terminals.append((nl, n - nl, FAIL, p0[nl], p1[nl]))
+                if nl == nu + 1:
+                    children.append((0, nu, nl, ne, nc, terminals))
+                    continue
+                # continuing points are nu + 1, ..., nl - 1
+                i, j = nu + 1 - low, nl - low
+                if ne + errorSum[j] - errorSum[i] > t * slack:
+                    continue
+                bound = max(nc + lam * (ne - t) + costSum[j] - costSum[i]
+                        for lam, costSum in zip(self.lambdas, costSums))
+                children.append((bound, nu, nl, ne, nc, terminals))
+
+        children.sort(key = lambda x: x[0])
+        for bound, nu, nl, ne, nc, terminals in children:
+            bestCost = self.bestCost
+            if self.sharedCost is not None:
+                bestCost = min(bestCost, self.sharedCost.value)
+            if approximate and bound * (1 + self.epsilon) >= bestCost:
+                # the children left cost at least bound, which is close
+                # enough to bestCost
+                self.lowerBound = min(self.lowerBound, bound)
+                break
+            if bound > bestCost * slack:
+                break
+            # push
+            self.terminals.extend(terminals)
+            savedX, savedY = self.x, self.y
+            if nu == 0 and u == -1:
+                self.y = n
+            elif nu >= 0:
+                self.upperLadder.append((nu, n - nu))
+            if nl == n and l == k + 1:
+                self.x = n
+            elif nl <= n:
+                self.lowerLadder.append((nl, n - nl))
+
+            if nl == nu + 1:
+                self._leaf(nl, n + 1 - nl)
+            else:
+                self._visit(n, nu, nl, [p0[x] for x in range(nu + 1, nl)],
+                        [p1[x] for x in range(nu + 1, nl)], ne, nc)
+
+            # pop
+            del self.terminals[len(self.terminals) - len(terminals):]
+            if self.y != savedY:
+                self.y = savedY
+            elif nu >= 0:
+                self.upperLadder.pop()
+            if self.x != savedX:
+                self.x = savedX
+            elif nl <= n:
+                self.lowerLadder.pop()
+
+    def _canStart(self, x, y, n):
+        """return whether some start point in self.startPoints agrees with
+        the start points x and y on anti-diagonal n, where None means that
+        the ladder has not started yet"""
+        for startX, startY in self.startPoints:
+            if (startX == x if x is not None else startX > n) and (startY == y if y is not None else startY > n):
+                return True
+        return False
+
+    def _leaf(self, decX, decY):
+        # sum e and c in the order of strategy.calc()
+        e = c = 0
+        for x, y, label, p0, p1 in sorted(self.terminals):
+            pReach = p0 + p1
+            if label == PASS:
+                e += p0
+            else:
+                e += p1
+            c += (x + y) * pReach
+        if e <= self.t:
+            candidate = (c, (self.x, self.y, decX, decY, list(self.upperLadder), list(self.lowerLadder)))
+            if self.best is None or candidate < self.best:
+                self.best = candidate
+                self.bestCost = c
+                if self.sharedCost is not None and c < self.sharedCost.value:
+                    self.sharedCost.value = c
 
 def calcLadderShapeCount(m):
     from math import factorial
@@ -251,25 +816,72 @@ def calcStepsToNearestTermPoint(strategyGrid):
     if (x,y) is a terminating point, then array[x][y] == 0. if (x,y) is
     unreachable, array[x][y] == -1"""
     gridLength = len(strategyGrid)
+    reached, order = _reachGrid(strategyGrid, gridLength, IndexError)
     grid = [ [ -1 for i in range(gridLength) ] for j in range(gridLength) ]
-
-    def recur(x, y):
+    # visit the reached points with x + y descending so that grid[x + 1][y]
+    # and grid[x][y + 1] are known before grid[x][y]
+    for x, y in reversed(order):
         val = strategyGrid[x][y]
         if val == PASS or val == FAIL:
             grid[x][y] = 0
-            return
-        if val == UNREACHABLE:
-            raise MeetUnreachableNode
-        if val == CONN:
-            if grid[x + 1][y] == -1:
-                recur(x + 1, y)
-            if grid[x][y + 1] == -1:
-                recur(x, y + 1)
+        elif val == CONN:
             grid[x][y] = min(grid[x + 1][y], grid[x][y + 1]) + 1
-
-    recur(0, 0)
     return grid
 
+def _reachGrid(strategyGrid, gridLength, outOfGrid):
+    """return (reached, order) where reached[x][y] indicates whether (x,y) is
+    reached from (0,0) through continuing points and order lists the reached
+    points with x + y ascending.
+
+    The anti-diagonals are swept forwards instead of visiting the points
+    recursively, so there is no limit on the grid size. If a reached point is
+    UNREACHABLE or a reached continuing point is on the border (`outOfGrid` is
+    raised in this case), the exception is the one a depth first search
+    (going right before going up) would meet first."""
+    reached = [ [ False for i in range(gridLength) ] for j in range(gridLength) ]
+    reached[0][0] = True
+    order = []
+    diagonal = [(0, 0)]
+    error = False
+    while diagonal:
+        order.extend(diagonal)
+        nextDiagonal = []
+        for x, y in diagonal:
+            val = strategyGrid[x][y]
+            if val == UNREACHABLE:
+                error = True
+            elif val == CONN:
+                if x + 1 == gridLength or y + 1 == gridLength:
+                    error = True
+                    continue
+                if not reached[x + 1][y]:
+                    reached[x + 1][y] = True
+                    nextDiagonal.append((x + 1, y))
+                if not reached[x][y + 1]:
+                    reached[x][y + 1] = True
+                    nextDiagonal.append((x, y + 1))
+        diagonal = nextDiagonal
+    if error:
+        _raiseFirstError(strategyGrid, gridLength, outOfGrid)
+    return reached, order
+
+def _raiseFirstError(strategyGrid, gridLength, outOfGrid):
+    # the depth first search with an explicit stack
+    visited = set()
+    stack = [(0, 0)]
+    while stack:
+        x, y = stack.pop()
+        if x >= gridLength or y >= gridLength:
+            raise outOfGrid
+        if (x, y) in visited:
+            continue
+        visited.add((x, y))
+        val = strategyGrid[x][y]
+        if val == UNREACHABLE:
+            raise MeetUnreachableNode
+        if val == CONN:
+            stack.append((x, y + 1))
+            stack.append((x + 1, y))
 
 
 
@@ -283,6 +895,16 @@ def calcStepsToNearestTermPoint(strategyGrid):
 #print(s.eEach)
 #printStrategy(s)
 
+#### test class arrayStrategy: should print the same as above
+#s = arrayStrategy(5, 0.5, 0.2, 0.1)
+#s.grid[0][2] = PASS
+#s.grid[1][1] = FAIL
+#s.grid[2][0] = FAIL
+#
+#s.calc()
+#print(s.eEach)
+#printStrategy(s)
+
 #### test ladderGenerator
 #lg = ladderGenerator(ladderGenerator.UPPER_LADDER)
 #lg.reset((0, 1), (3, 3))
@@ -313,6 +935,41 @@ def calcStepsToNearestTermPoint(strategyGrid):
 #printStrategy(getBestLadderStrategy(0.120, 3, 0.5, 0.2, 0.1))
 ## 
 #printStrategy(getBestLadderStrategy(0.2, 10, 0.5, 0.2, 0.1))
+#printStrategy(getBestLadderStrategy(0.05, 30, 0.5, 0.2, 0.2))
+#printStrategy(getBestLadderStrategy(0.05, 30, 0.5, 0.2, 0.2, workers = 4))
+#s = getBestLadderStrategy(0.05, 30, 0.5, 0.2, 0.2, epsilon = 0.05)
+#printStrategy(s)
+#print('gap: {:.3f}'.format(s.gap))
+
+#### ladderSearch test: all the methods should return the same strategy
+#for m in range(0, 8):
+#    for t in [0.01, 0.05, 0.1, 0.2]:
+#        for s, e0, e1 in [(0.5, 0.2, 0.1), (0.3, 0.1, 0.25), (0.8, 0.2, 0.2)]:
+#            a = getBestLadderStrategy(t, m, s, e0, e1, method = 'enumerate')
+#            for method in ['search', 'incremental']:
+#                b = getBestLadderStrategy(t, m, s, e0, e1, method = method)
+#                assert((a is None and b is None) or (a.grid == b.grid and a.e == b.e and a.c == b.c))
+
+#### test incrementalStrategy: figure 1(c) again, built by changing the grid
+#s = incrementalStrategy(5, 0.5, 0.2, 0.1)
+#s.setPoints([(0, 2), (1, 1), (2, 0)], FAIL)
+#s.calc()
+#s.setPoints([(0, 2)], PASS)
+#s.calc()
+#printStrategy(s)
 
 #for m in range(3, 14):
 #    print('m: {}\t shape count: {}'.format(m, calcLadderShapeCount(m)))
+
+#### benchmark checkGrid and calcStepsToNearestTermPoint: terminating points on x + y == m
+#import time
+#for m in [25, 50, 100, 200]:
+#    s = strategy(m, 0.5, 0.2, 0.2)
+#    for x in range(m + 1):
+#        s.grid[x][m - x] = PASS if m - x >= x else FAIL
+#    t0 = time.perf_counter()
+#    s.checkGrid()
+#    t1 = time.perf_counter()
+#    calcStepsToNearestTermPoint(s.grid)
+#    t2 = time.perf_counter()
+#    print('m: {}\t checkGrid: {:.4f}s\t calcStepsToNearestTermPoint: {:.4f}s'.format(m, t1 - t0, t2 - t1))
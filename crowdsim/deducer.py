@@ -1,22 +1,98 @@
 #!/usr/bin/env python3
 from .common import *
+from .common import numpy # None if NumPy is not available
 
 class BaseDeducer:
     pass
 
 class MajorityVote(BaseDeducer):
+    """Deduce the label of each task by the majority of its answers.
+
+    Ties are broken by the lowest label, as maxIndex() does. weights can be
+    None (one vote per answer), a callable accepting the worker ID or a
+    dict/list indexed by the worker ID, which gives weighted votes.
+
+    If the answers are kept in an AnswerTable and NumPy is available, the
+    votes are aggregated by a 2-D bincount over (task, label), and taskDict
+    and the SimpleAnswers are only built when they are read."""
+    def __init__(self, weights = None):
+        self.weights = weights
+
     def link(self, workerPool):
         self.workerPool = workerPool
-        self.taskDict = {}
+        self._taskDict = None
+        self._answerList = None
+        table = asAnswerTable(workerPool)
+        if table is not None and numpy is not None and len(table) > 0:
+            self._voteColumns(table)
+            return
+        weight = self._weightFunc()
+        taskDict = {}
         for a in workerPool:
-            if a.task not in self.taskDict:
-                self.taskDict[a.task] = [0 for x in range(a.task.labelCount)]
-            self.taskDict[a.task][a.label] += 1
-        self.answerList = []
-        for task in self.taskDict.keys():
-            self.answerList.append(SimpleAnswer(task, maxIndex(self.taskDict[task])))
+            if a.task not in taskDict:
+                taskDict[a.task] = [0 for x in range(a.task.labelCount)]
+            taskDict[a.task][a.label] += 1 if weight is None else weight(a.workerId)
+        self._taskDict = taskDict
+        self._answerList = [SimpleAnswer(task, maxIndex(votes)) for task, votes in taskDict.items()]
+
+    @property
+    def taskDict(self):
+        """{task : votes of each label}, in the order of the first answers of the tasks"""
+        if self._taskDict is None:
+            id_to_task = self._id_to_task
+            self._taskDict = {id_to_task[taskId] : votes[:labelCount] for taskId, votes, labelCount in
+                    zip(self._taskIds.tolist(), self._votes.tolist(), self._labelCounts.tolist())}
+        return self._taskDict
+
+    @property
+    def answerList(self):
+        if self._answerList is None:
+            self._answerList = list(self._iterColumns())
+        return self._answerList
+
     def __iter__(self):
-        return iter(self.answerList)
+        if self._answerList is None:
+            return self._iterColumns()
+        return iter(self._answerList)
+
+    def _iterColumns(self):
+        id_to_task = self._id_to_task
+        for taskId, label in zip(self._taskIds.tolist(), self._labels.tolist()):
+            yield SimpleAnswer(id_to_task[taskId], label)
+
+    def _weightFunc(self):
+        if self.weights is None or callable(self.weights):
+            return self.weights
+        return self.weights.__getitem__
+
+    def _voteColumns(self, table):
+        workerIds, taskIds, labels = table.arrays()
+        # number the tasks by their first answers, as the loop over the
+        # answers adds them to taskDict
+        ids, first, index = numpy.unique(taskIds, return_index = True, return_inverse = True)
+        order = numpy.argsort(first)
+        rank = numpy.empty_like(order)
+        rank[order] = numpy.arange(len(order))
+        self._id_to_task = table.id_to_task
+        self._taskIds = ids[order]
+        self._labelCounts = table.taskArray('labelCount')[self._taskIds]
+        if (labels >= self._labelCounts[rank[index]]).any():
+            # the same error as the loop over the answers
+            raise IndexError('list index out of range')
+        width = int(self._labelCounts.max())
+
+        weights = None
+        if self.weights is not None:
+            weight = self._weightFunc()
+            workers, workerIndex = numpy.unique(workerIds, return_inverse = True)
+            weights = numpy.array([weight(x) for x in workers.tolist()], dtype = numpy.float64)[workerIndex]
+        self._votes = numpy.bincount(rank[index] * width + labels, weights = weights,
+                minlength = len(ids) * width).reshape(len(ids), width)
+        # argmax() returns the lowest index of the maximum too, but the labels
+        # out of the label count of a task (whose votes are 0) should not be
+        # taken
+        inRange = numpy.arange(width) < self._labelCounts[:, None]
+        self._labels = numpy.where(inRange, self._votes, -numpy.inf).argmax(axis = 1)
 
 class Passer(BaseDeducer):
     """This deducer do nothing but pass the results directly. It is used when
@@ -1,25 +1,75 @@
 #Authors:  Jiannan Wang
 #DateTime: 2011-11-03 13:43
 #Function: Implement the get-another-label algorithm
+import itertools
+from collections import namedtuple
 from . import common
+from .common import numpy
 from .deducer import BaseDeducer
 
+# logLikelihood is the log-likelihood of the answers under the parameters of
+# the iteration and maxChange is the maximum change of the soft labels
+EMIteration = namedtuple('EMIteration', 'logLikelihood, maxChange')
+
 class EM(BaseDeducer):
-    def __init__(self, iterTimes):
+    def __init__(self, iterTimes, engine = None, tolerance = 0, stopOn = 'posterior', warmStart = False,
+            processes = None):
+        """engine can be "dict" (the original implementation, binary labels)
+        or "matrix" (see MatrixEstimateMaximize, NumPy is required). If it
+        is None, "matrix" is used if NumPy is available.
+
+        The following parameters need the matrix engine. If tolerance > 0,
+        iterTimes is the maximum number of iterations and the iterations stop
+        once the maximum change of the soft labels (stopOn = "posterior") or
+        the change of the log-likelihood per answer (stopOn = "likelihood")
+        is not larger than tolerance. If warmStart is True, every link()
+        after the first starts from the confusion matrices and priors of the
+        previous one; warmStart can also be a linked EM to start from. If
+        processes > 1, the iterations run on a pool of `processes` processes
+        (see _ShardedIterations)."""
+        if engine not in [None, 'dict', 'matrix']:
+            raise ValueError('Unsupported engine value ("{}")'.format(engine))
+        if stopOn not in ['posterior', 'likelihood']:
+            raise ValueError('Unsupported stopOn value ("{}")'.format(stopOn))
+        if tolerance < 0:
+            raise ValueError('tolerance should not be negative')
+        if engine == 'matrix' or (engine is None and numpy is not None):
+            engine = 'matrix'
+            if numpy is None:
+                raise ValueError('Engine "matrix" requires NumPy')
+        elif tolerance > 0 or warmStart is not False or (processes is not None and processes > 1):
+            raise ValueError('tolerance, warmStart and processes require the matrix engine')
         self.iterTimes = iterTimes
+        self.engine = engine
+        self.tolerance = tolerance
+        self.stopOn = stopOn
+        self.warmStart = warmStart
+        self.processes = processes
 
     def link(self, workerPool):
         self.workerPool = workerPool
+        if self.engine == 'matrix':
+            self.MatrixEstimateMaximize(workerPool)
+            return
         self.worker_example_label_set = []
         self.example_to_worker_label = {}
         self.worker_to_example_label = {}
         self.label_set = [0, 1]
         self.id2Task = {}
-        for a in workerPool:
-            self.worker_example_label_set.append((a.workerId, a.task.id, a.label))
-            self.example_to_worker_label.setdefault(a.task.id, []).append((a.workerId, a.label))
-            self.worker_to_example_label.setdefault(a.workerId, []).append((a.task.id, a.label))
-            self.id2Task[a.task.id] = a.task
+        table = common.asAnswerTable(workerPool)
+        if table is not None:
+            # read the columns directly
+            for workerId, taskId, label in zip(*table.columns()):
+                self.worker_example_label_set.append((workerId, taskId, label))
+                self.example_to_worker_label.setdefault(taskId, []).append((workerId, label))
+                self.worker_to_example_label.setdefault(workerId, []).append((taskId, label))
+            self.id2Task = {taskId : table.id_to_task[taskId] for taskId in self.example_to_worker_label}
+        else:
+            for a in workerPool:
+                self.worker_example_label_set.append((a.workerId, a.task.id, a.label))
+                self.example_to_worker_label.setdefault(a.task.id, []).append((a.workerId, a.label))
+                self.worker_to_example_label.setdefault(a.workerId, []).append((a.task.id, a.label))
+                self.id2Task[a.task.id] = a.task
         self.EstimateMaximize()
 
     def __iter__(self):
@@ -141,3 +191,491 @@ class EM(BaseDeducer):
         self.answerList = []
         for taskId, softlabel in example_to_softlabel.items():
             self.answerList.append(common.SimpleAnswer(self.id2Task[taskId], max(softlabel, key=softlabel.get)))
+
+    def MatrixEstimateMaximize(self, workerPool):
+        """The same EM as EstimateMaximize, kept in arrays.
+
+        The confusion matrices are kept in a (workers, labels, labels)
+        array, the soft labels in a (tasks, labels) array and the priors in
+        a (labels,) array, where the labels are 0, ..., labelCount - 1. Both
+        steps are scatter/gather over the answers (bincount), and the soft
+        labels are calculated in log space. The tasks and the ties of labels
+        are ordered as EstimateMaximize does, so the results on binary data
+        are the same (unless EstimateMaximize underflows).
+
+        self.history keeps an EMIteration of each iteration."""
+        workers, answerWorkers, id_to_task, answerTaskIds, answerLabels = self._answerArrays(workerPool)
+        self.history = []
+        if len(answerTaskIds) == 0:
+            self.workers, self.taskIds, self.label_set = [], [], []
+            self.priors = self.confusionMatrices = None
+            self.softLabels = numpy.zeros((0, 0))
+            self.answerList = []
+            return
+        # number the tasks by their first answers
+        ids, first, index = numpy.unique(answerTaskIds, return_index = True, return_inverse = True)
+        order = numpy.argsort(first)
+        rank = numpy.empty_like(order)
+        rank[order] = numpy.arange(len(order))
+        taskIds = ids[order].tolist()
+        e, w, l = rank[index], answerWorkers, answerLabels
+        taskCount, workerCount = len(taskIds), len(workers)
+        labelCount = max([id_to_task[x].labelCount for x in taskIds] + [int(l.max()) + 1 if len(l) > 0 else 1])
+        self.label_set = list(range(labelCount))
+
+        # Inital-Step
+        counts = numpy.bincount(e * labelCount + l, minlength = taskCount * labelCount).reshape(taskCount, labelCount)
+        softLabels = counts / counts.sum(axis = 1, keepdims = True)
+        warm = self._warmSoftLabels(softLabels, workers, labelCount, e, w, l)
+        priors = confusionMatrices = None
+        if self.processes is not None and 1 < self.processes <= len(l) and self.iterTimes > 0:
+            iterations = _ShardedIterations(self.processes, softLabels, e, w, l, workerCount)
+        else:
+            iterations = _Iterations(softLabels, e, w, l, workerCount)
+        with iterations:
+            for i in range(self.iterTimes):
+                priors, confusionMatrices, logLikelihood, maxChange = iterations.step()
+                self.history.append(EMIteration(logLikelihood, maxChange))
+                if self.tolerance > 0:
+                    if self.stopOn == 'posterior':
+                        change = maxChange
+                    elif i > 0:
+                        change = abs(logLikelihood - self.history[-2].logLikelihood) / len(l)
+                    else:
+                        continue
+                    if change <= self.tolerance:
+                        break
+        softLabels = iterations.softLabels
+        self.workers = workers
+        self.taskIds = taskIds
+        self.priors = priors
+        self.confusionMatrices = confusionMatrices
+        self.softLabels = softLabels
+
+        if len(self.history) == 0 and not warm:
+            # the most voted label, ties broken by the first answer
+            keys, firstAnswer = numpy.unique(e * labelCount + l, return_index = True)
+            firstAnswers = numpy.full(taskCount * labelCount, len(l))
+            firstAnswers[keys] = firstAnswer
+            firstAnswers = firstAnswers.reshape(taskCount, labelCount)
+            best = counts == counts.max(axis = 1, keepdims = True)
+            labels = numpy.where(best, firstAnswers, len(l) + 1).argmin(axis = 1)
+        else:
+            # ties are broken by the order of the labels in the priors of
+            # EstimateMaximize
+            labelOrder = numpy.array(_labelOrder(e, l, labelCount))
+            labels = labelOrder[softLabels[:, labelOrder].argmax(axis = 1)]
+        self.answerList = [common.SimpleAnswer(id_to_task[taskId], label) for taskId, label in zip(taskIds, labels.tolist())]
+
+    def _warmSoftLabels(self, softLabels, workers, labelCount, e, w, l):
+        """replace softLabels by the ones of the warm start and return whether
+        there is a warm start
+
+        The soft labels are calculated with the confusion matrices and
+        priors of the previous run, counting only the answers of the workers
+        known to it. The tasks without such answers keep their votes. There
+        is no warm start if the previous run did no iteration or had a
+        different labelCount."""
+        previous = self.warmStart
+        if previous is True:
+            previous = self
+        if previous is False or getattr(previous, 'confusionMatrices', None) is None \
+                or len(previous.priors) != labelCount:
+            return False
+        index = {x : i for i, x in enumerate(previous.workers)}
+        known = numpy.array([index.get(x, -1) for x in workers], dtype = numpy.int64)[w]
+        mask = known >= 0
+        logWeights = _logWeights(previous.priors, previous.confusionMatrices, e[mask], known[mask], l[mask], len(softLabels))
+        hasKnown = numpy.bincount(e[mask], minlength = len(softLabels)) > 0
+        softLabels[hasKnown] = _normalizeLogWeights(logWeights[hasKnown])
+        return True
+
+    def _answerArrays(self, workerPool):
+        """return (workers, answerWorkers, id_to_task, answerTaskIds, answerLabels)
+
+        workers is the list of the worker IDs and answerWorkers is the index
+        of the worker of each answer in it."""
+        table = common.asAnswerTable(workerPool)
+        if table is not None:
+            workerIds, taskIds, labels = table.arrays()
+            workers, answerWorkers = numpy.unique(workerIds, return_inverse = True)
+            return workers.tolist(), answerWorkers, table.id_to_task, taskIds, labels
+        workerIndex = {}
+        id_to_task = {}
+        answerWorkers, taskIds, labels = [], [], []
+        for a in workerPool:
+            answerWorkers.append(workerIndex.setdefault(a.workerId, len(workerIndex)))
+            taskIds.append(a.task.id)
+            labels.append(a.label)
+            id_to_task[a.task.id] = a.task
+        return (list(workerIndex), numpy.array(answerWorkers, dtype = numpy.int64), id_to_task,
+                numpy.array(taskIds, dtype = numpy.int64), numpy.array(labels, dtype = numpy.int64))
+
+class OnlineEM(BaseDeducer):
+    """EM which takes the answers as they arrive (NumPy is required)
+
+    Answers are added by add(), addMany() or link(). The soft labels of the
+    tasks, the soft confusion counts of the workers (the soft labels of the
+    tasks they answer summed by their labels) and the sums of the soft
+    labels are kept, so that update() only runs the E-step on the tasks
+    which got new answers since the last update (`steps` times), fixing the
+    counts by the changes of their soft labels. update() is called after
+    every `updateEvery` answers and by snapshot(); refresh() runs the E-step
+    on all the tasks. The counts are smoothed by adding `smoothing` to each
+    of them.
+
+    A new task starts from the fractions of the votes of its answers, so
+    with smoothing = 0, link() followed by refresh() k - 1 times is EM(k)
+    (the answers of a task can only be in one update for this)."""
+    def __init__(self, labelCount = 2, updateEvery = 1000, steps = 1, smoothing = 1.0):
+        if numpy is None:
+            raise ValueError('OnlineEM requires NumPy')
+        if smoothing < 0:
+            raise ValueError('smoothing should not be negative')
+        self.labelCount = labelCount
+        self.updateEvery = updateEvery
+        self.steps = steps
+        self.smoothing = smoothing
+        self.workers = []
+        self.workerIndex = {}
+        self.tasks = []
+        self.taskIndex = {}
+        # the indices of the answers of each task
+        self.taskAnswers = []
+        self.answerCount = 0
+        self._answerWorkers = numpy.empty(0, dtype = numpy.int64)
+        self._answerTasks = numpy.empty(0, dtype = numpy.int64)
+        self._answerLabels = numpy.empty(0, dtype = numpy.int64)
+        self._softLabels = numpy.empty((0, labelCount))
+        self._counts = numpy.zeros((0, labelCount, labelCount))
+        self._priorSums = numpy.zeros(labelCount)
+        # the answers and tasks added since the last update
+        self._pending = ([], [], [])
+        self._taskCount = 0
+
+    def link(self, workerPool):
+        self.workerPool = workerPool
+        self.addMany(workerPool)
+        self.update()
+
+    def add(self, answer):
+        self.addMany([answer])
+
+    def addMany(self, answers):
+        pendingWorkers, pendingTasks, pendingLabels = self._pending
+        for workerId, task, label in self._rows(answers):
+            if not 0 <= label < self.labelCount:
+                raise ValueError('Label {} is out of range(labelCount)'.format(label))
+            worker = self.workerIndex.get(workerId)
+            if worker is None:
+                worker = self.workerIndex[workerId] = len(self.workers)
+                self.workers.append(workerId)
+            taskIndex = self.taskIndex.get(task.id)
+            if taskIndex is None:
+                taskIndex = self.taskIndex[task.id] = len(self.tasks)
+                self.tasks.append(task)
+                self.taskAnswers.append([])
+            self.taskAnswers[taskIndex].append(self.answerCount + len(pendingWorkers))
+            pendingWorkers.append(worker)
+            pendingTasks.append(taskIndex)
+            pendingLabels.append(label)
+            if len(pendingWorkers) >= self.updateEvery:
+                self.update()
+                pendingWorkers, pendingTasks, pendingLabels = self._pending
+
+    def update(self):
+        """add the pending answers and run the E-step on their tasks"""
+        if len(self._pending[0]) == 0:
+            return
+        w, e, l = [numpy.array(x, dtype = numpy.int64) for x in self._pending]
+        self._pending = ([], [], [])
+        start = self.answerCount
+        self.answerCount += len(w)
+        self._answerWorkers = _extend(self._answerWorkers, start, w)
+        self._answerTasks = _extend(self._answerTasks, start, e)
+        self._answerLabels = _extend(self._answerLabels, start, l)
+        labelCount = self.labelCount
+        workerCount, taskCount = len(self.workers), len(self.tasks)
+        if len(self._counts) < workerCount:
+            self._counts = _extend(self._counts, len(self._counts),
+                    numpy.zeros((workerCount - len(self._counts), labelCount, labelCount)))
+        if self._taskCount < taskCount:
+            # new tasks start from the fractions of their votes
+            newTasks = e >= self._taskCount
+            votes = numpy.bincount((e[newTasks] - self._taskCount) * labelCount + l[newTasks],
+                    minlength = (taskCount - self._taskCount) * labelCount).reshape(-1, labelCount)
+            votes = votes / votes.sum(axis = 1, keepdims = True)
+            self._softLabels = _extend(self._softLabels, self._taskCount, votes)
+            self._priorSums += votes.sum(axis = 0)
+            self._taskCount = taskCount
+        _addCounts(self._counts, self._softLabels[:taskCount], e, w, l)
+        tasks = numpy.unique(e)
+        for i in range(self.steps):
+            self._eStep(tasks)
+
+    def refresh(self):
+        """run the E-step on all the tasks"""
+        self.update()
+        self._eStep(None)
+
+    def snapshot(self):
+        """return the deduced answers (a list of SimpleAnswer) of all the answers added"""
+        self.update()
+        labels = self.softLabels.argmax(axis = 1).tolist()
+        return [common.SimpleAnswer(task, label) for task, label in zip(self.tasks, labels)]
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    @property
+    def softLabels(self):
+        return self._softLabels[:self._taskCount]
+
+    @property
+    def priors(self):
+        s = self.smoothing
+        return (self._priorSums + s) / max(self._taskCount + self.labelCount * s, 1)
+
+    @property
+    def confusionMatrices(self):
+        """confusionMatrices[worker][finalLabel][workerLabel] of the workers (in self.workers)"""
+        counts = self._counts[:len(self.workers)] + self.smoothing
+        totals = counts.sum(axis = 2, keepdims = True)
+        return numpy.divide(counts, totals, out = numpy.zeros_like(counts), where = totals > 0)
+
+    def _eStep(self, tasks):
+        """run the E-step on the task indices (all the tasks if None)"""
+        answerCount = self.answerCount
+        if tasks is None:
+            tasks = numpy.arange(self._taskCount)
+            e = self._answerTasks[:answerCount]
+            answers = slice(0, answerCount)
+        else:
+            answers = numpy.fromiter(itertools.chain.from_iterable(self.taskAnswers[x] for x in tasks.tolist()),
+                    dtype = numpy.int64)
+            local = numpy.full(self._taskCount, -1, dtype = numpy.int64)
+            local[tasks] = numpy.arange(len(tasks))
+            e = local[self._answerTasks[answers]]
+        w, l = self._answerWorkers[answers], self._answerLabels[answers]
+        logWeights = _logWeights(self.priors, self.confusionMatrices, e, w, l, len(tasks))
+        delta = _normalizeLogWeights(logWeights) - self._softLabels[tasks]
+        _addCounts(self._counts, delta, e, w, l)
+        self._priorSums += delta.sum(axis = 0)
+        # the rounding errors of the deltas can make the counts of a label
+        # no task takes slightly negative
+        numpy.maximum(self._counts, 0, out = self._counts)
+        numpy.maximum(self._priorSums, 0, out = self._priorSums)
+        self._softLabels[tasks] += delta
+
+    @staticmethod
+    def _rows(answers):
+        """yield (workerId, task, label) of the answers"""
+        table = common.asAnswerTable(answers)
+        if table is not None:
+            for workerId, taskId, label in zip(*table.columns()):
+                yield workerId, table.id_to_task[taskId], label
+        else:
+            for a in answers:
+                yield a.workerId, a.task, a.label
+
+def _extend(array, size, values):
+    """return array[:size] followed by values, growing array by doubling if needed"""
+    end = size + len(values)
+    if len(array) < end:
+        grown = numpy.zeros((max(end, 2 * len(array)),) + array.shape[1:], dtype = array.dtype)
+        grown[:size] = array[:size]
+        array = grown
+    array[size:end] = values
+    return array
+
+def _addCounts(counts, softLabels, e, w, l):
+    """add softLabels[e] to counts[w, :, l] of each answer"""
+    workerCount, labelCount = len(counts), counts.shape[1]
+    for f in range(labelCount):
+        counts[:, f, :] += numpy.bincount(w * labelCount + l, weights = softLabels[e, f],
+                minlength = workerCount * labelCount).reshape(workerCount, labelCount)
+
+class _Iterations:
+    """the EM iterations starting from softLabels
+
+    e, w and l are the task, worker and label of each answer."""
+    def __init__(self, softLabels, e, w, l, workerCount):
+        self.softLabels = softLabels
+        self.e, self.w, self.l = e, w, l
+        self.workerCount = workerCount
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def step(self):
+        """run an iteration and return (priors, confusionMatrices, logLikelihood, maxChange)"""
+        e, w, l, softLabels = self.e, self.w, self.l, self.softLabels
+        taskCount = len(softLabels)
+        priors = softLabels.sum(axis = 0) / taskCount
+        confusionMatrices = _normalizeCounts(_softCounts(softLabels, e, w, l, self.workerCount))
+        logWeights = _logWeights(priors, confusionMatrices, e, w, l, taskCount)
+        self.softLabels = _normalizeLogWeights(logWeights)
+        logLikelihood = float(_logSumExp(logWeights).sum())
+        maxChange = float(numpy.abs(self.softLabels - softLabels).max()) if taskCount > 0 else 0.0
+        return priors, confusionMatrices, logLikelihood, maxChange
+
+class _ShardedIterations(_Iterations):
+    """the EM iterations with the tasks split into shards run by a process pool
+
+    The answers (sorted by task) and the soft labels are kept in shared
+    memory, and there is a shard of consecutive tasks with about the same
+    number of answers for each process. In each iteration, every shard runs
+    the E-step of its tasks and returns the soft confusion counts and the
+    sums of the soft labels of them, which are summed up for the M-step of
+    the next iteration. Only the priors and the confusion matrices are sent
+    to the processes."""
+    def __init__(self, processes, softLabels, e, w, l, workerCount):
+        import multiprocessing
+        from multiprocessing import shared_memory
+        order = numpy.argsort(e, kind = 'stable')
+        e = e[order]
+        self.memory = []
+        self.pool = self.softLabels = None
+        self.workerCount = workerCount
+        try:
+            shared = {}
+            for name, array in [('e', e), ('w', w[order]), ('l', l[order]), ('softLabels', softLabels)]:
+                memory = shared_memory.SharedMemory(create = True, size = max(array.nbytes, 1))
+                self.memory.append(memory)
+                numpy.ndarray(array.shape, array.dtype, memory.buf)[...] = array
+                shared[name] = (memory.name, array.shape, array.dtype.str)
+            self.softLabels = numpy.ndarray(softLabels.shape, softLabels.dtype, self.memory[-1].buf)
+            # split at the tasks of every len(e) / processes answers (there
+            # are at least `processes` answers, see MatrixEstimateMaximize)
+            taskCount = len(softLabels)
+            bounds = sorted(set([0, taskCount] + [int(e[k * len(e) // processes]) for k in range(1, processes)]))
+            answerBounds = numpy.searchsorted(e, bounds).tolist()
+            self.shards = list(zip(bounds, bounds[1:], answerBounds, answerBounds[1:]))
+            self.pool = multiprocessing.Pool(processes, _attachShared, (shared,))
+            self.counts, self.sums = self._map(None, None)[:2]
+        except BaseException:
+            self.__exit__()
+            raise
+
+    def __exit__(self, *args):
+        """stop the pool and release the shared memory (the soft labels are copied)"""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        # the views should be released before closing the shared memory
+        if self.softLabels is not None:
+            self.softLabels = numpy.array(self.softLabels)
+        for memory in self.memory:
+            memory.close()
+            memory.unlink()
+        self.memory = []
+
+    def step(self):
+        priors = self.sums / len(self.softLabels)
+        confusionMatrices = _normalizeCounts(self.counts)
+        self.counts, self.sums, logLikelihood, maxChange = self._map(priors, confusionMatrices)
+        return priors, confusionMatrices, logLikelihood, maxChange
+
+    def _map(self, priors, confusionMatrices):
+        """run _shardStep on all the shards and return the reduced (counts, sums, logLikelihood, maxChange)"""
+        results = self.pool.map(_shardStep, [(shard, priors, confusionMatrices, self.workerCount) for shard in self.shards])
+        counts, sums, logLikelihoods, maxChanges = zip(*results)
+        return sum(counts), sum(sums), float(sum(logLikelihoods)), float(max(maxChanges))
+
+# the shared arrays of _ShardedIterations in the processes of the pool
+_shared = {}
+
+def _attachShared(shared):
+    from multiprocessing import shared_memory
+    for name, (memoryName, shape, dtype) in shared.items():
+        memory = shared_memory.SharedMemory(name = memoryName)
+        _shared[name] = (memory, numpy.ndarray(shape, dtype, memory.buf))
+
+def _shardStep(args):
+    """run the E-step (if priors is not None) on a shard and return (counts, sums, logLikelihood, maxChange)"""
+    (start, end, answerStart, answerEnd), priors, confusionMatrices, workerCount = args
+    e = _shared['e'][1][answerStart:answerEnd] - start
+    w = _shared['w'][1][answerStart:answerEnd]
+    l = _shared['l'][1][answerStart:answerEnd]
+    softLabels = _shared['softLabels'][1][start:end]
+    logLikelihood = maxChange = 0.0
+    if priors is not None:
+        logWeights = _logWeights(priors, confusionMatrices, e, w, l, end - start)
+        newSoftLabels = _normalizeLogWeights(logWeights)
+        logLikelihood = float(_logSumExp(logWeights).sum())
+        if end > start:
+            maxChange = float(numpy.abs(newSoftLabels - softLabels).max())
+        softLabels[...] = newSoftLabels
+    return _softCounts(softLabels, e, w, l, workerCount), softLabels.sum(axis = 0), logLikelihood, maxChange
+
+def _softCounts(softLabels, e, w, l, workerCount):
+    """return counts[worker][finalLabel][workerLabel], the sums of softLabels[e, finalLabel] of the answers"""
+    labelCount = softLabels.shape[1]
+    counts = numpy.zeros((workerCount, labelCount, labelCount))
+    _addCounts(counts, softLabels, e, w, l)
+    return counts
+
+def _normalizeCounts(counts):
+    """return the confusion matrices of the soft confusion counts"""
+    totals = counts.sum(axis = 2, keepdims = True)
+    return numpy.divide(counts, totals, out = numpy.zeros_like(counts), where = totals > 0)
+
+def _logWeights(priors, confusionMatrices, e, w, l, taskCount):
+    """return the (taskCount, labelCount) log of the prior times the probabilities of the answers"""
+    with numpy.errstate(divide = 'ignore'):
+        logConfusionMatrices = numpy.log(confusionMatrices)
+        logWeights = numpy.tile(numpy.log(priors), (taskCount, 1))
+    for f in range(len(priors)):
+        logWeights[:, f] += numpy.bincount(e, weights = logConfusionMatrices[w, f, l], minlength = taskCount)
+    return logWeights
+
+def _logSumExp(logWeights):
+    """return the log of the sums of the rows of exp(logWeights)"""
+    top = logWeights.max(axis = 1, keepdims = True)
+    top[~numpy.isfinite(top)] = 0
+    with numpy.errstate(divide = 'ignore'):
+        return (top + numpy.log(numpy.exp(logWeights - top).sum(axis = 1, keepdims = True)))[:, 0]
+
+def _normalizeLogWeights(logWeights):
+    """return the rows of exp(logWeights) divided by their sums (all zeros if a row is all -inf)"""
+    top = logWeights.max(axis = 1, keepdims = True)
+    valid = numpy.isfinite(top)
+    weights = numpy.exp(logWeights - numpy.where(valid, top, 0))
+    return weights / numpy.where(valid, weights.sum(axis = 1, keepdims = True), 1)
+
+def _labelOrder(e, l, labelCount):
+    """return the labels in the order EstimateMaximize inserts them to the priors
+
+    The priors are summed over the tasks in the order of their first
+    answers, and over the labels of each task in the order of their first
+    answers. The labels without any answer are put last."""
+    keys, firstAnswer = numpy.unique(e * labelCount + l, return_index = True)
+    seen = {}
+    # keys are sorted by task, so the first key of a label is its first task
+    for key, answer in zip(keys.tolist(), firstAnswer.tolist()):
+        task, label = divmod(key, labelCount)
+        if label not in seen:
+            seen[label] = (task, answer)
+    return sorted(seen, key = seen.get) + [x for x in range(labelCount) if x not in seen]
+
+#### test OnlineEM: with smoothing = 0, link() plus k - 1 refresh() is EM(k)
+#import random
+#from .common import SimpleTask, Answer
+#for seed in range(100):
+#    random.seed(seed)
+#    tasks = [SimpleTask(i, 2, random.randint(0, 1)) for i in range(100)]
+#    accuracies = [random.uniform(0.5, 1.0) for x in range(20)]
+#    answers = [Answer(w, t, t.trueLabel if random.random() < accuracies[w] else 1 - t.trueLabel)
+#            for t in tasks for w in random.sample(range(20), 3)]
+#    online = OnlineEM(smoothing = 0, updateEvery = 10 ** 9)
+#    online.link(answers)
+#    for i in range(4):
+#        online.refresh()
+#    em = EM(5)
+#    em.link(answers)
+#    softLabels = online.softLabels[[online.taskIndex[x] for x in em.taskIds]]
+#    assert numpy.isfinite(softLabels).all() and numpy.allclose(softLabels, em.softLabels)
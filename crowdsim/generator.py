@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
-import random
+import random, array
 from .common import *
+from .common import numpy # None if NumPy is not available
 
 class BaseGenerator:
     pass
 
 class GeneralGenerator(BaseGenerator):
     """Class to generate some SimpleHIT """
-    def __init__(self, taskCount, labelCount, trueLabel=None):
+    def __init__(self, taskCount, labelCount, trueLabel=None, lazy = False):
         """Init...
 
         Parameter:
@@ -19,6 +20,9 @@ class GeneralGenerator(BaseGenerator):
             trueLabel: Can be None, callable/iterable object or int. If is
             None, the trueLabels are assigned randomly if labelCount is not
             None.
+
+            lazy: If True, id_to_task is a TaskSequence which builds the
+            tasks on demand instead of a list of them.
         """
         self.taskCount = taskCount
         if labelCount is not None:
@@ -31,6 +35,10 @@ class GeneralGenerator(BaseGenerator):
             self.labelCountGenerator = lambda x : None
             self.trueLabelGenerator = lambda x : None
 
+        if lazy:
+            self.id_to_task = self._lazyTasks(labelCount, trueLabel)
+            self.taskList = self.id_to_task
+            return
         self.id_to_task = []
         self.taskList = self.id_to_task
         for self.ongoingTaskId in range(self.taskCount):
@@ -43,3 +51,84 @@ class GeneralGenerator(BaseGenerator):
 
     def __iter__(self):
         return iter(self.id_to_task)
+
+    def _lazyTasks(self, labelCount, trueLabel):
+        """return the TaskSequence of the lazy mode
+
+        Constant label counts and true labels are kept as they are. If the
+        label count is a constant int and trueLabel is None, the true labels
+        are drawn at once into a compact array (by NumPy, seeded from
+        `random`, if it is available). Otherwise the generators are called
+        once per task as in the eager mode and their results are kept in
+        compact arrays, so that the tasks built on demand are always the
+        same."""
+        if labelCount is None:
+            return TaskSequence(self.taskCount, None, None)
+        if isinstance(labelCount, int):
+            if isinstance(trueLabel, int):
+                return TaskSequence(self.taskCount, labelCount, trueLabel)
+            if trueLabel is None:
+                if numpy is not None:
+                    rng = numpy.random.default_rng(random.getrandbits(64))
+                    trueLabels = rng.integers(labelCount, size = self.taskCount, dtype = _smallestType(labelCount))
+                else:
+                    trueLabels = array.array(_smallestTypecode(labelCount),
+                            (random.randrange(labelCount) for i in range(self.taskCount)))
+                return TaskSequence(self.taskCount, labelCount, trueLabels)
+        labelCounts = array.array('i')
+        trueLabels = array.array('i')
+        for self.ongoingTaskId in range(self.taskCount):
+            self.ongoingLabelCount = self.labelCountGenerator(self.ongoingTaskId) # for defaultTrueLabelGenerator()
+            labelCounts.append(self.ongoingLabelCount)
+            trueLabels.append(self.trueLabelGenerator(self.ongoingTaskId))
+        return TaskSequence(self.taskCount, labelCounts, trueLabels)
+
+class TaskSequence:
+    """A read-only sequence of SimpleTask whose item i is the task of id i
+
+    The tasks are built on demand. labelCounts and trueLabels are either
+    constants (ints or None) or sequences indexed by the task id."""
+    def __init__(self, taskCount, labelCounts, trueLabels):
+        self.taskCount = taskCount
+        self.labelCounts = labelCounts
+        self.trueLabels = trueLabels
+
+    def __len__(self):
+        return self.taskCount
+
+    def __getitem__(self, taskId):
+        if not 0 <= taskId < self.taskCount:
+            raise IndexError('Task id {} out of range'.format(taskId))
+        return SimpleTask(taskId, self._get(self.labelCounts, taskId), self._get(self.trueLabels, taskId))
+
+    def __iter__(self):
+        for taskId in range(self.taskCount):
+            yield SimpleTask(taskId, self._get(self.labelCounts, taskId), self._get(self.trueLabels, taskId))
+
+    def taskArray(self, field):
+        """return a NumPy array a where a[taskId] is the field (e.g.
+        "trueLabel") of the task (NumPy is required)"""
+        if field == 'id':
+            return numpy.arange(self.taskCount, dtype = numpy.int64)
+        values = {'labelCount' : self.labelCounts, 'trueLabel' : self.trueLabels}[field]
+        if values is None or isinstance(values, int):
+            return numpy.full(self.taskCount, values, dtype = numpy.int64 if values is not None else object)
+        return numpy.asarray(values).astype(numpy.int64)
+
+    @staticmethod
+    def _get(values, taskId):
+        if values is None or isinstance(values, int):
+            return values
+        return int(values[taskId])
+
+def _smallestType(labelCount):
+    for dtype in (numpy.int8, numpy.int16, numpy.int32):
+        if labelCount - 1 <= numpy.iinfo(dtype).max:
+            return dtype
+    return numpy.int64
+
+def _smallestTypecode(labelCount):
+    for typecode in 'bhi':
+        if labelCount <= 2 ** (8 * array.array(typecode).itemsize - 1):
+            return typecode
+    return 'q'
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""A cache of the best ladder strategies keyed by (t, m, s, e0, e1)"""
+import collections, itertools, json, sqlite3
+from . import crowdscreen
+
+class StrategyCache:
+    """Cache the strategies returned by crowdscreen.getBestLadderStrategy()
+
+    The strategies are kept in an in-process LRU of `maxsize` entries and,
+    if `path` is given, in a sqlite database which keeps the grid, e, c and
+    eEach of each strategy (p0/p1 are not kept). Float parameters are
+    canonicalized so that e.g. 0.1 + 0.2 and 0.3 share the same entry.
+
+    The returned strategies are shared and should not be modified."""
+    def __init__(self, path = None, maxsize = 128, method = 'search'):
+        self.maxsize = maxsize
+        self.method = method
+        self.lru = collections.OrderedDict()
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path)
+            self.db.execute('CREATE TABLE IF NOT EXISTS strategy (t REAL, m INTEGER, '
+                    's REAL, e0 REAL, e1 REAL, grid BLOB, e REAL, c REAL, eEach TEXT, '
+                    'PRIMARY KEY (t, m, s, e0, e1))')
+            self.db.commit()
+
+    @staticmethod
+    def key(t, m, s, e0, e1):
+        """return the canonicalized parameters"""
+        return (_canonical(t), int(m), _canonical(s), _canonical(e0), _canonical(e1))
+
+    def get(self, t, m, s, e0, e1):
+        """return the best ladder strategy (or None), calculating it if it is not cached"""
+        key = self.key(t, m, s, e0, e1)
+        found, strategy = self._lookup(key)
+        if not found:
+            strategy = crowdscreen.getBestLadderStrategy(*key, method = self.method)
+            self._store(key, strategy)
+        return strategy
+
+    def __contains__(self, parameters):
+        return self._lookup(self.key(*parameters))[0]
+
+    def warm(self, ts, ms, ss, e0s, e1s, workers = None):
+        """calculate and cache the strategies of all combinations of the parameters
+
+        If workers > 1, the missing strategies are calculated by a pool of
+        `workers` processes."""
+        keys = []
+        for parameters in itertools.product(ts, ms, ss, e0s, e1s):
+            key = self.key(*parameters)
+            if key not in keys and not self._lookup(key)[0]:
+                keys.append(key)
+        if workers is None or workers <= 1:
+            strategies = [crowdscreen.getBestLadderStrategy(*x, method = self.method) for x in keys]
+        else:
+            import multiprocessing
+            with multiprocessing.Pool(workers) as pool:
+                strategies = pool.starmap(crowdscreen.getBestLadderStrategy,
+                        [x + (self.method,) for x in keys], chunksize = 1)
+        for key, strategy in zip(keys, strategies):
+            self._store(key, strategy)
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def _lookup(self, key):
+        """return (found, strategy)"""
+        if key in self.lru:
+            self.lru.move_to_end(key)
+            return True, self.lru[key]
+        if self.db is not None:
+            row = self.db.execute('SELECT grid, e, c, eEach FROM strategy WHERE '
+                    't = ? AND m = ? AND s = ? AND e0 = ? AND e1 = ?', key).fetchone()
+            if row is not None:
+                strategy = None if row[0] is None else _decode(key, *row)
+                self._remember(key, strategy)
+                return True, strategy
+        return False, None
+
+    def _store(self, key, strategy):
+        self._remember(key, strategy)
+        if self.db is not None:
+            if strategy is None:
+                row = (None, None, None, None)
+            else:
+                row = _encode(strategy)
+            self.db.execute('INSERT OR REPLACE INTO strategy VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', key + row)
+            self.db.commit()
+
+    def _remember(self, key, strategy):
+        if self.maxsize <= 0:
+            return
+        self.lru[key] = strategy
+        self.lru.move_to_end(key)
+        while len(self.lru) > self.maxsize:
+            self.lru.popitem(last = False)
+
+def _canonical(x):
+    return float('{:.12g}'.format(x))
+
+def _encode(strategy):
+    """return (grid, e, c, eEach) to be stored in the database"""
+    # grid values are in [-1, 2], stored as one byte per point
+    grid = bytes(int(v) + 1 for column in strategy.grid for v in column)
+    eEach = json.dumps([[x, y, v] for (x, y), v in strategy.eEach.items()])
+    return (grid, strategy.e, strategy.c, eEach)
+
+def _decode(key, grid, e, c, eEach):
+    t, m, s, e0, e1 = key
+    strategy = crowdscreen.strategy(m, s, e0, e1)
+    strategy.grid = [[v - 1 for v in grid[x * (m + 1):(x + 1) * (m + 1)]] for x in range(m + 1)]
+    strategy.e = e
+    strategy.c = c
+    strategy.eEach = {(x, y): v for x, y, v in json.loads(eEach)}
+    return strategy
+
+# used by assigner.BaseStrategyAssigner when no cache is given
+defaultCache = StrategyCache()
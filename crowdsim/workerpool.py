@@ -1,5 +1,9 @@
 import random
 from .common import *
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 def solveTask(task, workerAccuracy):
     if random.random() > workerAccuracy: # wrong answer
@@ -24,25 +28,42 @@ class BaseWorkerPool:
     pass
 
 class PWorkerPool(BaseWorkerPool):
-    def __init__(self, workerCount, accuracyFunc, assignWeights=None):
+    def __init__(self, workerCount, accuracyFunc, assignWeights=None, batch = False, prefetch = 0):
         """Init...
 
         Parameter:
             accuracyFunc: accuracyFunc should be function accept the worker ID and return accuracy.
             assignWeights: None if weights are equal or a iterable cantaining the integer weights for all workers.
+            batch: If True, link() only accepts the non-adaptive assigners
+            (SimpleAssigner and SimpleAssigner2) and simulates all the
+            answers at once (see linkBatch()).
+            prefetch: If > 0, link() draws the workers in blocks of
+            `prefetch` draws (by NumPy if it is available) instead of one
+            by one.
         """
         self.workerCount = workerCount
         self.accuracyFunc = accuracyFunc
+        self.batch = batch
+        self.prefetch = prefetch
         self.cost = 0
         if assignWeights is None:
+            self.assignWeights = None
             self.randomWorkerGenerator = self.randomWorkerDirectly
         else:
-            self.randomWorkerGenerator = WeightedRandom(assignWeights)
+            self.assignWeights = list(assignWeights)
+            self.randomWorkerGenerator = WeightedRandom(self.assignWeights)
     def link(self, assigner):
+        if self.batch:
+            self.linkBatch(assigner)
+            return
         self.assigner = assigner
-        self.answerList = []
+        self.answerList = AnswerTable()
+        if self.prefetch > 0:
+            randomWorker = self.prefetchedWorkers(self.prefetch).__next__
+        else:
+            randomWorker = self.randomWorkerGenerator
         while True:
-            workerId = self.randomWorkerGenerator()
+            workerId = randomWorker()
             try:
                 task = assigner.assign(workerId)
             except RunOutOfAllTask:
@@ -56,15 +77,136 @@ class PWorkerPool(BaseWorkerPool):
         return iter(self.answerList)
     def randomWorkerDirectly(self):
         return random.randrange(self.workerCount)
+    def prefetchedWorkers(self, blockSize):
+        """yield random workers endlessly, drawn in blocks of blockSize"""
+        if self.assignWeights is not None:
+            sample = self.randomWorkerGenerator.sample
+        elif numpy is not None:
+            rng = numpy.random.default_rng(random.getrandbits(64))
+            sample = lambda n: rng.integers(self.workerCount, size = n)
+        else:
+            sample = lambda n: [random.randrange(self.workerCount) for i in range(n)]
+        while True:
+            block = sample(blockSize)
+            # python ints are faster to use than NumPy ones
+            yield from (block.tolist() if numpy is not None else block)
     def _solve(self, task, workerId):
         return solveTask(task, self.accuracyFunc(workerId))
 
+    def linkBatch(self, assigner):
+        """Simulate the answers of a SimpleAssigner or SimpleAssigner2 at once.
+
+        Each task of the assigner's generator is answered by `duplicate`
+        different workers, drawn with the assign weights, as link() does
+        with these assigners. accuracyFunc is called once per worker. The
+        assigner itself is not called. The answers are kept in an
+        AnswerTable (sorted by task) and drawn with NumPy if it is
+        available, using a NumPy generator seeded from `random`."""
+        from .assigner import SimpleAssigner, SimpleAssigner2
+        if not isinstance(assigner, (SimpleAssigner, SimpleAssigner2)):
+            raise ValueError('Batch mode does not support {}'.format(type(assigner).__name__))
+        duplicate = assigner.duplicate
+        positiveCount = self.workerCount if self.assignWeights is None else sum(1 for x in self.assignWeights if x > 0)
+        if duplicate > positiveCount:
+            raise ValueError('Not enough workers for duplicate = {}'.format(duplicate))
+        self.assigner = assigner
+        id_to_task = getattr(assigner.generator, 'id_to_task', None)
+        workerProperties = [self.accuracyFunc(w) for w in range(self.workerCount)]
+        if numpy is not None and hasattr(id_to_task, 'taskArray'):
+            # the tasks of a lazy GeneralGenerator are read as arrays, not built
+            taskCount = len(id_to_task)
+            taskFields = [id_to_task.taskArray(x) for x in ('id', 'trueLabel', 'labelCount')]
+        else:
+            tasks = list(assigner.generator)
+            taskCount = len(tasks)
+            if id_to_task is None:
+                id_to_task = {task.id : task for task in tasks}
+            if numpy is not None:
+                taskFields = [numpy.array([getattr(task, x) for task in tasks], dtype = numpy.int64)
+                        for x in ('id', 'trueLabel', 'labelCount')]
+        if numpy is None:
+            workerIds, taskIds, labels = [], [], []
+            for task in tasks:
+                workers = set()
+                while len(workers) < duplicate:
+                    workerId = self.randomWorkerGenerator()
+                    if workerId not in workers:
+                        workers.add(workerId)
+                        workerIds.append(workerId)
+                        taskIds.append(task.id)
+                        labels.append(self._solveWithProperty(task, workerProperties[workerId]))
+        else:
+            rng = numpy.random.default_rng(random.getrandbits(64))
+            workers = self._drawWorkersBatch(rng, taskCount, duplicate)
+            workerIds = workers.ravel()
+            taskIds, trueLabels, labelCounts = [numpy.repeat(x, duplicate) for x in taskFields]
+            labels = self._solveBatch(rng, numpy.array(workerProperties, dtype = numpy.float64)[workerIds],
+                    trueLabels, labelCounts)
+        self.answerList = AnswerTable(id_to_task, workerIds, taskIds, labels)
+        self.cost += len(self.answerList)
+
+    def _drawWorkersBatch(self, rng, taskCount, duplicate):
+        """return a (taskCount, duplicate) array of worker ids, different within each row"""
+        if self.assignWeights is None:
+            workers = rng.integers(self.workerCount, size = (taskCount, duplicate))
+            # draw the rows with repeated workers again
+            rows = numpy.arange(taskCount)
+            while len(rows) > 0:
+                drawn = workers[rows]
+                repeated = numpy.zeros(len(rows), dtype = bool)
+                for i in range(duplicate):
+                    for j in range(i):
+                        repeated |= drawn[:, i] == drawn[:, j]
+                rows = rows[repeated]
+                workers[rows] = rng.integers(self.workerCount, size = (len(rows), duplicate))
+            return workers
+
+        # Like the draws without NumPy, the workers of a task are drawn one
+        # after another in proportion to their weights, skipping the workers
+        # already drawn. This is the same as taking the `duplicate` largest
+        # keys log(u) / weight of each row (Efraimidis and Spirakis).
+        weights = numpy.array(self.assignWeights, dtype = numpy.float64)
+        workers = numpy.empty((taskCount, duplicate), dtype = numpy.int64)
+        chunkSize = max(1, 2 ** 20 // self.workerCount)
+        with numpy.errstate(divide = 'ignore'):
+            for start in range(0, taskCount, chunkSize):
+                rowCount = min(chunkSize, taskCount - start)
+                # the workers with zero weights get -inf
+                keys = numpy.log(rng.random((rowCount, self.workerCount))) / weights
+                if duplicate < self.workerCount:
+                    top = numpy.argpartition(keys, self.workerCount - duplicate, axis = 1)[:, -duplicate:]
+                else:
+                    top = numpy.broadcast_to(numpy.arange(self.workerCount), (rowCount, self.workerCount))
+                # in the order of the draws
+                order = numpy.argsort(-numpy.take_along_axis(keys, top, axis = 1), axis = 1)
+                workers[start:start + rowCount] = numpy.take_along_axis(top, order, axis = 1)
+        return workers
+
+    def _solveWithProperty(self, task, accuracy):
+        return solveTask(task, accuracy)
+
+    def _solveBatch(self, rng, accuracies, trueLabels, labelCounts):
+        """the vectorized solveTask()"""
+        wrong = rng.random(len(trueLabels)) > accuracies
+        wrongLabels = (rng.random(len(trueLabels)) * (labelCounts - 1)).astype(numpy.int64)
+        same = wrongLabels == trueLabels
+        wrongLabels[same] = labelCounts[same] - 1
+        return numpy.where(wrong, wrongLabels, trueLabels)
+
 class PWorkerPool2(PWorkerPool):
-    def __init__(self, workerCount, accuracyFunc, assignWeights = None):
+    def __init__(self, workerCount, accuracyFunc, assignWeights = None, batch = False, prefetch = 0):
         """Identical to PWorkerPool except the return values of accuracyFunc.
         
         accuracyFunc should return a tuple (false positive rate, false negetive rate)
         """
-        PWorkerPool.__init__(self, workerCount, accuracyFunc, assignWeights)
+        PWorkerPool.__init__(self, workerCount, accuracyFunc, assignWeights, batch, prefetch)
     def _solve(self, task, workerId):
         return solveTask2(task, *self.accuracyFunc(workerId))
+    def _solveWithProperty(self, task, rates):
+        return solveTask2(task, *rates)
+    def _solveBatch(self, rng, rates, trueLabels, labelCounts):
+        """the vectorized solveTask2()"""
+        assert((labelCounts == 2).all())
+        p = numpy.where(trueLabels == 0, rates[:, 0], rates[:, 1])
+        flip = rng.random(len(trueLabels)) <= p
+        return numpy.where(flip, 1 - trueLabels, trueLabels)
@@ -1,6 +1,7 @@
 from .common import *
 from .workerpool import BaseWorkerPool
-import logging
+import logging, collections, threading
+import concurrent.futures, http.server, urllib.parse
 from .agent.AMT import flags, TimeUnit as tu
 import time
 
@@ -9,20 +10,69 @@ import time
 class amt(BaseWorkerPool):
     def __init__(self, amtAgent, HITParameterConstructor, answerConstructor,
             responseGroup_createHIT = None,
-            responseGroup_getAssignmentsForHIT = None):
+            responseGroup_getAssignmentsForHIT = None, maxInFlight = 1,
+            notificationReceiver = None, pagePrefetch = 0):
+        """If maxInFlight > 1, up to maxInFlight createHIT, extendHIT and
+        getAssignmentsForHIT calls are made at the same time by a thread pool
+        (the agent should keep as many connections alive, see AMT(poolSize)).
+        The HITs are still recorded, and the answers given to
+        assigner.update(), in the same order as with maxInFlight = 1.
+
+        notificationReceiver should be None or a NotificationReceiver, see
+        updateAnswers().
+
+        If pagePrefetch > 0, the reviewable HITs are streamed by
+        getReviewableHITs(stream = True, prefetch = pagePrefetch) and their
+        assignments are requested as the pages arrive."""
         self.agent = amtAgent
         self.HPConstructor = HITParameterConstructor
         self.answerConstructor = answerConstructor
         self.rg_createHIT = responseGroup_createHIT
         self.rg_getAssignmentsForHIT = responseGroup_getAssignmentsForHIT
         self.extendTime = 1 * tu.day
+        # the interval of polling is between minSleepTime and sleepTime
+        self.minSleepTime = 10
         self.sleepTime = 5 * tu.minute
+        self.receiver = notificationReceiver
+        self.maxInFlight = maxInFlight
+        self.pagePrefetch = pagePrefetch
+        self.executor = None
+        # task -> (AnonymousAssignment, Future of createHIT) of the HITs not recorded yet
+        self.pendingHITs = collections.OrderedDict()
+        # Futures of the extendHIT calls not finished yet
+        self.pendingCalls = []
 
     def _agentWrapper(self, methodName, *args, **kwargs):
         r = getattr(self.agent, methodName)(*args, **kwargs)
         assert(r != False and r != None)
         return r
 
+    def _submit(self, methodName, *args, **kwargs):
+        """call _agentWrapper() by the thread pool (or now if there is not any) and return a Future"""
+        if self.executor is not None:
+            return self.executor.submit(self._agentWrapper, methodName, *args, **kwargs)
+        future = concurrent.futures.Future()
+        future.set_result(self._agentWrapper(methodName, *args, **kwargs))
+        return future
+
+    def _finishPending(self):
+        """wait for the pending calls and record the created HITs in the order of creation"""
+        for aa, future in self.pendingHITs.values():
+            response = future.result()
+            hitInfo = {}
+            hitInfo['id'] = response[0]
+            hitInfo['task'] = aa.task
+            hitInfo['duplicate'] = aa.duplicate
+            hitInfo['answerCount'] = 0
+            hitInfo['HITElement'] = response[2]
+
+            self.task2hitInfo[aa.task] = hitInfo
+            self.hitId2info[hitInfo['id']] = hitInfo
+        self.pendingHITs.clear()
+        for future in self.pendingCalls:
+            future.result()
+        self.pendingCalls = []
+
     def __iter__(self):
         return iter(self.answerList)
         
@@ -32,11 +82,23 @@ class amt(BaseWorkerPool):
         self.task2hitInfo = {}
         self.hitId2info = {}
         self.assignmentIds = set()
+        self.pollInterval = self.minSleepTime
+        if self.maxInFlight > 1:
+            self.executor = concurrent.futures.ThreadPoolExecutor(self.maxInFlight)
+        try:
+            self._link()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+    def _link(self):
         while True:
             try:
                 aa = self.assigner.assign2()
             except RunOutOfAllTask:
                 # get all answers before leaving
+                self._finishPending()
                 totalDuplicate = 0
                 for hitInfo in self.task2hitInfo.values():
                     totalDuplicate += hitInfo['duplicate']
@@ -50,58 +112,157 @@ class amt(BaseWorkerPool):
                 logging.info('Encounter RunOutOfActiveTask')
                 self.updateAnswers()
             else:
+                if aa.task in self.pendingHITs:
+                    # the HIT id is needed to extend it
+                    self._finishPending()
                 if aa.task in self.task2hitInfo:
                     # extend hit
                     logging.info('Extending HIT: task.id = {} duplicate = {}'.format(aa.task.id, aa.duplicate))
                     hitInfo = self.task2hitInfo[aa.task]
-                    self._agentWrapper('extendHIT', hitInfo['id'], aa.duplicate, self.extendTime)
+                    self.pendingCalls.append(self._submit('extendHIT', hitInfo['id'], aa.duplicate, self.extendTime))
                     hitInfo['duplicate'] += aa.duplicate
                 else:
                     # create new hit
                     logging.info('Creating HIT: task.id = {} assignments = {}'.format(aa.task.id, aa.duplicate))
-                    hitInfo = {}
                     hp = self.HPConstructor(aa)
-                    response = self._agentWrapper('createHIT', hp, responseGroup = self.rg_createHIT)
-                    hitInfo['id'] = response[0]
-                    hitInfo['task'] = aa.task
-                    hitInfo['duplicate'] = aa.duplicate
-                    hitInfo['answerCount'] = 0
-                    hitInfo['HITElement'] = response[2]
-
-                    self.task2hitInfo[aa.task] = hitInfo
-                    self.hitId2info[hitInfo['id']] = hitInfo
+                    self.pendingHITs[aa.task] = (aa, self._submit('createHIT', hp, responseGroup = self.rg_createHIT))
 
     def updateAnswers(self):
+        """Get the new answers and give them to the assigner, waiting until there is any
+
+        The assignments of the reviewable HITs (and of the HITs notified by
+        the notificationReceiver) with outstanding assignments are fetched.
+        If nothing new arrives, it waits for pollInterval seconds (or until a
+        notification arrives) and polls again; pollInterval doubles after
+        each idle poll up to sleepTime and is reset to minSleepTime once new
+        answers arrive."""
+        self._finishPending()
+        notified = self._wait(0)
         updated = False
         while True:
             logging.info('Updating answers ...')
-            hitIds = self._agentWrapper('getReviewableHITs', sortProperty = flags.sortProperty.enumeration)
-            for id in hitIds:
-                if id not in self.hitId2info:
-                    continue
-                # XXX: set the hit to reviewing
-                hitInfo = self.hitId2info[id]
-                if hitInfo['answerCount'] != hitInfo['duplicate']:
-                    assignments = self._agentWrapper('getAssignmentsForHIT',
-                            id, responseGroup = self.rg_getAssignmentsForHIT)
-                    for ass in assignments:
-                        if ass[0] not in self.assignmentIds:
-                            self.assignmentIds.add(ass[0])
-                            updated = True
-                            answer = self.answerConstructor(hitInfo, ass)
-                            self.answerList.append(answer)
-                            hitInfo['answerCount'] += 1
-
-                            self.assigner.update(answer.workerId, answer.task, answer.label)
-
-                    assert(hitInfo['answerCount'] == len(assignments))
-                    if hitInfo['answerCount'] != hitInfo['duplicate']:
-                        # Still unequal means hit became reviewable because of expiration. let extend it.
-                        logging.info('Task {} expired, extending it'.format(hitInfo['task'].id))
-                        self._agentWrapper('extendHIT', hitInfo['id'], expirationIncrementInSeconds =
-                                self.extendTime)
+            # XXX: set the hit to reviewing
+            hitInfos = []
+            futures = []
+            def fetch(id):
+                hitInfo = self.hitId2info.get(id)
+                if hitInfo is not None and hitInfo['answerCount'] != hitInfo['duplicate']:
+                    hitInfos.append(hitInfo)
+                    futures.append(self._submit('getAssignmentsForHIT', id,
+                            responseGroup = self.rg_getAssignmentsForHIT))
+            # the assignments are fetched at the same time but handled in order
+            reviewable = set()
+            for id in self._reviewableHITs():
+                reviewable.add(id)
+                fetch(id)
+            for id in notified:
+                if id not in reviewable:
+                    fetch(id)
+            for hitInfo, future in zip(hitInfos, futures):
+                assignments = future.result()
+                for ass in assignments:
+                    if ass[0] not in self.assignmentIds:
+                        self.assignmentIds.add(ass[0])
+                        updated = True
+                        answer = self.answerConstructor(hitInfo, ass)
+                        self.answerList.append(answer)
+                        hitInfo['answerCount'] += 1
+
+                        self.assigner.update(answer.workerId, answer.task, answer.label)
+
+                assert(hitInfo['answerCount'] == len(assignments))
+                if hitInfo['answerCount'] != hitInfo['duplicate'] and hitInfo['id'] in reviewable:
+                    # Still unequal means hit became reviewable because of expiration. let extend it.
+                    logging.info('Task {} expired, extending it'.format(hitInfo['task'].id))
+                    self.pendingCalls.append(self._submit('extendHIT', hitInfo['id'],
+                            expirationIncrementInSeconds = self.extendTime))
+            self._finishPending()
             if updated:
                 logging.info('Finish updating (total answer count = {})'.format(len(self.answerList)))
+                self.pollInterval = self.minSleepTime
                 break
-            logging.info('Fail to update (total answer count = {}): sleep for {} seconds'.format(len(self.answerList), self.sleepTime))
-            time.sleep(self.sleepTime)
+            logging.info('Fail to update (total answer count = {}): wait for {} seconds'.format(len(self.answerList), self.pollInterval))
+            notified = self._wait(self.pollInterval)
+            if not notified:
+                self.pollInterval = min(self.sleepTime, self.pollInterval * 2)
+
+    def _reviewableHITs(self):
+        """return the ids of the reviewable HITs, streamed if pagePrefetch > 0"""
+        if self.pagePrefetch > 0:
+            return self.agent.getReviewableHITs(sortProperty = flags.sortProperty.enumeration,
+                    stream = True, prefetch = self.pagePrefetch)
+        return self._agentWrapper('getReviewableHITs', sortProperty = flags.sortProperty.enumeration)
+
+    def _wait(self, seconds):
+        """wait for seconds or a notification, return the notified HIT ids"""
+        if self.receiver is None:
+            if seconds > 0:
+                time.sleep(seconds)
+            return []
+        return self.receiver.wait(seconds)
+
+class NotificationReceiver:
+    """A local HTTP endpoint receiving the REST notifications of AMT
+
+    The HIT ids of the received notifications (the Event.n.HITId
+    parameters, sent by GET or POST) are kept until they are taken by
+    wait(). Register `url` (which must be reachable by AMT) as the
+    destination of the notifications of the HIT type, e.g.
+
+        agent.request('SetHITTypeNotification', {'HITTypeId' : typeId,
+            'Notification.1.Destination' : receiver.url,
+            'Notification.1.Transport' : 'REST',
+            'Notification.1.Version' : '2006-05-05',
+            'Notification.1.EventType' : 'AssignmentSubmitted',
+            'Active' : 'True'})"""
+    def __init__(self, host = '', port = 0, publicUrl = None):
+        """The endpoint listens on (host, port); port 0 picks a free port.
+        publicUrl overrides the url (e.g. behind a proxy)"""
+        self.hitIds = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        receiver = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+            def do_GET(self):
+                self._receive(urllib.parse.urlsplit(self.path).query)
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self._receive(urllib.parse.urlsplit(self.path).query + '&' + body.decode('utf-8'))
+            def _receive(self, query):
+                receiver.notify(v for k, v in urllib.parse.parse_qsl(query)
+                        if k.startswith('Event.') and k.endswith('.HITId'))
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        if publicUrl is None:
+            publicUrl = 'http://{}:{}/'.format(host or 'localhost', self.server.server_address[1])
+        self.url = publicUrl
+        self.thread = threading.Thread(target = self.server.serve_forever, daemon = True)
+        self.thread.start()
+
+    def notify(self, hitIds):
+        """record the hitIds and wake up wait()"""
+        with self.lock:
+            for id in hitIds:
+                self.hitIds[id] = None
+            if self.hitIds:
+                self.event.set()
+
+    def wait(self, timeout = None):
+        """wait until there is any notification or timeout, return (and forget) the notified HIT ids"""
+        self.event.wait(timeout)
+        with self.lock:
+            hitIds = list(self.hitIds)
+            self.hitIds.clear()
+            self.event.clear()
+        return hitIds
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()